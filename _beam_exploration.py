@@ -0,0 +1,187 @@
+# _beam_exploration.py
+import contextvars
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from _metrics import increment, set_gauge
+
+logger = logging.getLogger(__name__)
+
+BEAM_WIDTH = 2              # Branches kept after each depth
+BRANCHING_FACTOR = 2        # Candidate next_questions expanded per kept branch
+MAX_PARALLEL_BRANCHES = 4   # Branch evaluations in flight at once, across the whole beam
+EXPLORATION_TOKEN_BUDGET = None # Optional cap on tokens spent exploring (on top of the session budget)
+
+def _normalize_question(question):
+    return " ".join((question or "").lower().split())
+
+class BeamExplorer:
+    """
+    Explores a topic breadth-first instead of following next_questions[0] one turn at a time.
+    Each depth expands up to `branching_factor` next_questions of every kept branch concurrently,
+    scores the new branches by their overall_grade and keeps the top `beam_width`.
+    Expansion stops at `max_depth`, when no new questions remain, or when the budgets
+    (the exploration token cap and the session's token/cost/time budgets) cannot cover
+    another branch, projected from the average branch cost so far.
+    """
+    def __init__(self, beam_width=BEAM_WIDTH, branching_factor=BRANCHING_FACTOR,
+                 max_parallel_branches=MAX_PARALLEL_BRANCHES, token_budget=EXPLORATION_TOKEN_BUDGET,
+                 session_budget=None):
+        self.beam_width = beam_width
+        self.branching_factor = branching_factor
+        self.max_parallel_branches = max_parallel_branches
+        self.token_budget = token_budget
+        self.session_budget = session_budget
+        self._node_ids = itertools.count(1)
+        self.stats = {"branches_evaluated": 0, "branches_failed": 0, "branches_pruned": 0, "branches_skipped_for_budget": 0}
+
+    def _usage(self):
+        """(tokens, cost) charged to the session budget so far."""
+        if self.session_budget is None:
+            return 0, 0.0
+        return self.session_budget.tokens_used, self.session_budget.cost_used_usd
+
+    def _branches_affordable(self, usage_at_start, requested, depth_seconds):
+        """
+        How many of `requested` branches fit in the remaining budgets, projecting each
+        branch's tokens and cost from the average so far (and a depth's duration from
+        `depth_seconds`, since branches within a depth run concurrently).
+        Returns (count, reason) where `reason` names the limiting budget, if any.
+        """
+        if self.session_budget is None:
+            return requested, None
+        if self.session_budget.evaluate()["end_session"]:
+            return 0, "session budget exhausted"
+        evaluated = self.stats["branches_evaluated"]
+        if not evaluated:
+            return requested, None
+        tokens, cost = self._usage()
+        spent_tokens, spent_cost = tokens - usage_at_start[0], cost - usage_at_start[1]
+        remaining = self.session_budget.remaining()
+
+        # (budget name, amount left, projected amount per branch)
+        limits = [
+            ("session token budget", remaining.get("tokens"), spent_tokens / evaluated),
+            ("session cost budget", remaining.get("cost"), spent_cost / evaluated),
+        ]
+        if self.token_budget:
+            limits.append(("exploration token budget", self.token_budget - spent_tokens, spent_tokens / evaluated))
+
+        affordable, reason = requested, None
+        for name, left, per_branch in limits:
+            if left is None or per_branch <= 0:
+                continue
+            fits = max(0, int(left // per_branch))
+            if fits < affordable:
+                affordable, reason = fits, f"{name} exhausted"
+        time_left = remaining.get("time")
+        if time_left is not None and depth_seconds and time_left < sum(depth_seconds) / len(depth_seconds):
+            affordable, reason = 0, "session time budget exhausted"
+        return affordable, reason
+
+    def explore(self, root_question, max_depth, evaluate_fn, history_entry_fn, on_branch=None):
+        """
+        Runs the beam search and returns a summary dict (levels, best_path, stop_reason, stats).
+
+        `evaluate_fn(question, history_entries)` runs one branch and returns its turn_data
+        (with grade_data and next_questions); `history_entry_fn(turn_data)` builds the compact
+        history entry passed to child branches; `on_branch(node, turn_data)` is called on the
+        calling thread for every evaluated branch (e.g. to log it).
+        """
+        usage_at_start = self._usage()
+        depth_seconds = [] # Wall-clock duration of each evaluated depth
+        seen_questions = {_normalize_question(root_question)}
+        frontier = [{"id": 0, "parent_id": None, "depth": 0, "score": None, "history": [], "next_questions": [root_question]}]
+        levels = []
+        best_node = None
+        stop_reason = "max_depth_reached"
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel_branches, thread_name_prefix="beam-branch") as executor:
+            for depth in range(1, max_depth + 1):
+                # The root is expanded once; every later depth takes branching_factor questions per kept branch
+                candidates = []
+                for parent in frontier:
+                    for question in parent["next_questions"][:self.branching_factor if depth > 1 else 1]:
+                        key = _normalize_question(question)
+                        if depth > 1 and key in seen_questions:
+                            continue
+                        seen_questions.add(key)
+                        candidates.append((parent, question))
+                if not candidates:
+                    stop_reason = "no_new_questions"
+                    break
+
+                affordable, budget_reason = self._branches_affordable(usage_at_start, len(candidates), depth_seconds)
+                if affordable < len(candidates):
+                    self.stats["branches_skipped_for_budget"] += len(candidates) - affordable
+                    increment("beam_branches_total", len(candidates) - affordable, outcome="skipped_for_budget")
+                    candidates = candidates[:affordable] # Frontier is sorted best-first, so the best parents go first
+                if not candidates:
+                    stop_reason = f"budget: {budget_reason}"
+                    break
+
+                logger.info(f"Beam depth {depth}: evaluating {len(candidates)} branch(es) with up to {self.max_parallel_branches} in parallel.")
+                set_gauge("beam_branches_in_flight", len(candidates))
+                depth_started = time.monotonic()
+                # Each branch runs in its own copy of the caller's context (session budget, LLM phase)
+                futures = {
+                    executor.submit(contextvars.copy_context().run, evaluate_fn, question, parent["history"]): (parent, question)
+                    for parent, question in candidates
+                }
+                children = []
+                for future in as_completed(futures):
+                    parent, question = futures[future]
+                    try:
+                        turn_data = future.result()
+                    except Exception as e:
+                        logger.error(f"Beam branch '{question}' failed: {e}")
+                        self.stats["branches_failed"] += 1
+                        increment("beam_branches_total", outcome="failed")
+                        continue
+                    score = turn_data.get("grade_data", {}).get("overall_grade")
+                    node = {
+                        "id": next(self._node_ids),
+                        "parent_id": parent["id"] or None,
+                        "depth": depth,
+                        "question": question,
+                        "score": score if isinstance(score, (int, float)) else 0.0,
+                        "next_questions": turn_data.get("next_questions") or [],
+                        "path": parent.get("path", []) + [question],
+                    }
+                    self.stats["branches_evaluated"] += 1
+                    increment("beam_branches_total", outcome="evaluated")
+                    if on_branch:
+                        on_branch(node, turn_data)
+                    # Built after on_branch so the entry reflects anything it recorded (e.g. the turn number)
+                    node["history"] = parent["history"] + [history_entry_fn(turn_data)]
+                    children.append(node)
+                set_gauge("beam_branches_in_flight", 0)
+                depth_seconds.append(time.monotonic() - depth_started)
+
+                children.sort(key=lambda node: node["score"], reverse=True)
+                kept, pruned = children[:self.beam_width], children[self.beam_width:]
+                self.stats["branches_pruned"] += len(pruned)
+                increment("beam_branches_total", len(pruned), outcome="pruned")
+                levels.append({
+                    "depth": depth,
+                    "evaluated": len(children),
+                    "kept": [{"id": node["id"], "score": node["score"], "question": node["question"]} for node in kept],
+                    "pruned": [node["id"] for node in pruned],
+                })
+                if kept and (best_node is None or kept[0]["score"] >= best_node["score"]):
+                    best_node = kept[0]
+                if not kept:
+                    stop_reason = "all_branches_failed"
+                    break
+                frontier = kept
+
+        return {
+            "levels": levels,
+            "best_path": best_node["path"] if best_node else [],
+            "best_score": best_node["score"] if best_node else None,
+            "stop_reason": stop_reason,
+            "tokens_used": self._usage()[0] - usage_at_start[0],
+            "stats": dict(self.stats),
+        }
@@ -0,0 +1,229 @@
+# _collaboration.py
+import contextvars
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _llm_utils import call_llm_with_retry
+from _structured_output import call_llm_structured
+from _convergence import synthesis_novelty
+from _metrics import increment, observe
+
+logger = logging.getLogger(__name__)
+
+DEBATE_ROUNDS = 3              # Round 1 is independent feedback; later rounds critique the other experts
+MAX_PARALLEL_EXPERTS = 4       # Concurrent expert calls per round
+# Debate stops once the experts' revisions, on average, mostly restate their previous round
+# (content-word novelty as in _convergence: about 0.35-0.5 for a reworded position)
+MIN_FEEDBACK_NOVELTY = 0.5
+
+class CollaborationEngine:
+    """
+    Runs a collaboration as a debate: every round fans out to the experts concurrently,
+    from round 2 on each expert sees the others' previous feedback and revises its own,
+    and the debate ends early once the feedback stops changing. The Super Agent then
+    synthesizes the final positions with its own configured model.
+    """
+    def __init__(self, max_rounds=DEBATE_ROUNDS, max_parallel_experts=MAX_PARALLEL_EXPERTS,
+                 min_feedback_novelty=MIN_FEEDBACK_NOVELTY):
+        self.max_rounds = max_rounds
+        self.max_parallel_experts = max_parallel_experts
+        self.min_feedback_novelty = min_feedback_novelty
+
+    def _expert_feedback(self, expert_name, config, expert_profile, topic, initial_idea, previous_round):
+        """Returns one expert's feedback for a round; `previous_round` is None in the first round."""
+        expert_collaboration_mode = expert_profile.get("collaboration_mode", "general feedback")
+        # Static per expert and topic (cacheable prefix); the idea and the debate so far follow it
+        expert_prompt = f"""
+        You are {expert_profile.get('profile_name', expert_name)}. Your role is {expert_profile.get('role', 'an expert')}.
+        The Super Agent will propose ideas for collaboration on the topic "{topic}".
+
+        Your collaboration mode is: "{expert_collaboration_mode}".
+        Please provide your feedback, critique, alternative perspectives, or suggestions for refinement based on your expertise and collaboration mode.
+        """
+        if previous_round is None:
+            user_message = f"Provide feedback on the idea: '{initial_idea}'"
+        else:
+            others = {name: feedback for name, feedback in previous_round.items() if name != expert_name}
+            user_message = (
+                f"The idea: '{initial_idea}'\n\n"
+                f"Your previous feedback was:\n{previous_round.get(expert_name, '')}\n\n"
+                f"The other experts said:\n{json.dumps(others, indent=2)}\n\n"
+                "Critique their points where you disagree, adopt what is convincing, "
+                "and give your revised feedback on the idea."
+            )
+        response = call_llm_with_retry(
+            config["client"],
+            config["model"],
+            messages=[
+                {"role": "system", "content": expert_prompt},
+                {"role": "user", "content": user_message}
+            ],
+            temperature=0.7,
+            max_tokens=400
+        )
+        return response.choices[0].message.content
+
+    def _run_round(self, round_number, experts, expert_profiles, topic, initial_idea, previous_round):
+        """Queries `experts` concurrently; returns ({expert: feedback}, {expert: error})."""
+        feedback, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_parallel_experts, len(experts))),
+                                thread_name_prefix="collaboration") as executor:
+            # Each call runs in its own copy of the caller's context so the session budget is charged
+            futures = {
+                expert_name: executor.submit(
+                    contextvars.copy_context().run, self._expert_feedback,
+                    expert_name, config, expert_profiles.get(expert_name, {}), topic, initial_idea, previous_round
+                )
+                for expert_name, config in experts.items()
+            }
+            for expert_name, future in futures.items():
+                try:
+                    feedback[expert_name] = future.result()
+                    logger.debug(f"Received round {round_number} collaboration feedback from {expert_name}")
+                except Exception as e:
+                    logger.error(f"Error getting round {round_number} collaboration feedback from {expert_name}: {e}")
+                    errors[expert_name] = e
+        return feedback, errors
+
+    def run(self, super_agent_client, super_agent_model, expert_llm_clients, topic, initial_idea,
+            collaboration_style, expert_profiles):
+        """Runs the debate and the synthesis and returns the turn's collaboration_data."""
+        logger.info(f"Super Agent initiating collaboration on idea: '{initial_idea}'")
+        started = time.monotonic()
+
+        sa_collaboration_prompt = f"""
+        You are the Super Agent. You are initiating a collaborative discussion on the topic "{topic}".
+        The idea we are exploring is: "{initial_idea}"
+        Your collaboration style is: {collaboration_style}.
+
+        I will share this idea with the expert advisors. Please prepare to synthesize their feedback
+        and refine the idea or formulate new questions based on their input.
+        """
+        collaboration_log = [{"speaker": "Super Agent (Initiator)", "message": sa_collaboration_prompt}]
+
+        expert_feedback = {} # Latest position of every expert that has answered
+        rounds = []
+        active_experts = dict(expert_llm_clients)
+        stop_reason = "max_rounds_reached"
+        for round_number in range(1, self.max_rounds + 1):
+            round_started = time.monotonic()
+            previous_round = dict(expert_feedback) if round_number > 1 else None
+            feedback, errors = self._run_round(
+                round_number, active_experts, expert_profiles, topic, initial_idea, previous_round
+            )
+            round_latency = time.monotonic() - round_started
+            observe("collaboration_round_latency_seconds", round_latency)
+            increment("collaboration_rounds_total")
+
+            for expert_name, error in errors.items():
+                collaboration_log.append({"speaker": expert_name, "round": round_number, "message": f"Error: {error}"})
+                if round_number == 1:
+                    expert_feedback[expert_name] = f"Error: Could not get feedback from {expert_name}."
+                active_experts.pop(expert_name, None) # A failing expert sits out the rest of the debate
+            for expert_name, message in feedback.items():
+                collaboration_log.append({"speaker": expert_name, "round": round_number, "message": message})
+
+            # How much each expert changed its position since the previous round
+            novelty = {
+                expert_name: round(synthesis_novelty(message, [previous_round[expert_name]]), 4)
+                for expert_name, message in feedback.items()
+                if previous_round and expert_name in previous_round
+            }
+            expert_feedback.update(feedback)
+            rounds.append({
+                "round": round_number,
+                "experts": sorted(feedback),
+                "failed_experts": sorted(errors),
+                "latency_seconds": round(round_latency, 3),
+                "feedback_novelty": novelty
+            })
+
+            if len(active_experts) < 2:
+                stop_reason = "too_few_experts_to_debate"
+                break
+            mean_novelty = sum(novelty.values()) / len(novelty) if novelty else None
+            if mean_novelty is not None and mean_novelty < self.min_feedback_novelty:
+                stop_reason = f"feedback converged (mean novelty {mean_novelty:.2f} < {self.min_feedback_novelty})"
+                if round_number < self.max_rounds:
+                    increment("collaboration_early_stops_total")
+                    logger.info(f"Collaboration debate converged after round {round_number}; skipping the remaining rounds.")
+                break
+
+        debate_transcript = {
+            f"round_{entry['round']}": {name: message for name, message in _round_messages(collaboration_log, entry["round"])}
+            for entry in rounds[:-1]
+        }
+        # Instructions and schema first (cacheable prefix), then this collaboration's idea and feedback
+        sa_synthesis_collab_prompt = f"""
+        You are the Super Agent. You have received feedback from your expert advisors on an idea,
+        after one or more rounds of debate between them; both follow in the user message.
+
+        Based on this feedback and your {collaboration_style} style, please:
+        1.  Refine the initial idea.
+        2.  Summarize the key takeaways from the collaboration.
+        3.  Formulate 1-2 new questions that emerged from this collaborative discussion for further learning.
+
+        Return ONLY a JSON object:
+        {{
+          "refined_idea": "...",
+          "summary": "...",
+          "new_questions": ["...", "..."]
+        }}
+        """
+        collaboration_prompt = f"""The idea: "{initial_idea}"
+
+Expert Feedback (final positions after {len(rounds)} round(s) of debate): {json.dumps(expert_feedback, indent=2)}"""
+        if debate_transcript:
+            collaboration_prompt += f"\n\nEarlier debate rounds: {json.dumps(debate_transcript, indent=2)}"
+        synthesis_started = time.monotonic()
+        try:
+            collab_result, _ = call_llm_structured(
+                super_agent_client,
+                super_agent_model, # The Super Agent synthesizes with its own configured model
+                messages=[
+                    {"role": "system", "content": sa_synthesis_collab_prompt},
+                    {"role": "user", "content": collaboration_prompt}
+                ],
+                schema_name="collaboration",
+                temperature=0.5,
+                max_tokens=800
+            )
+            collaboration_log.append({"speaker": "Super Agent (Synthesis)", "message": collab_result})
+            logger.debug("Super Agent collaboration synthesis complete.")
+        except Exception as e:
+            logger.error(f"Error during Super Agent collaboration synthesis: {e}")
+            collab_result = {
+                "refined_idea": f"Collaboration failed: {e}",
+                "summary": "Failed to synthesize collaboration feedback.",
+                "new_questions": []
+            }
+            collaboration_log.append({"speaker": "Super Agent (Error)", "message": f"Error: {e}"})
+        synthesis_latency = time.monotonic() - synthesis_started
+
+        return {
+            "initial_idea": initial_idea,
+            "expert_feedback": expert_feedback,
+            "refined_idea": collab_result.get("refined_idea"),
+            "summary": collab_result.get("summary"),
+            "new_questions": collab_result.get("new_questions"),
+            "rounds": rounds,
+            "rounds_completed": len(rounds),
+            "stop_reason": stop_reason,
+            "super_agent_model": super_agent_model,
+            "latency_seconds": {
+                "debate": round(sum(entry["latency_seconds"] for entry in rounds), 3),
+                "synthesis": round(synthesis_latency, 3),
+                "total": round(time.monotonic() - started, 3)
+            },
+            "collaboration_log": collaboration_log # Store the back-and-forth
+        }
+
+def _round_messages(collaboration_log, round_number):
+    return [
+        (entry["speaker"], entry["message"]) for entry in collaboration_log
+        if entry.get("round") == round_number and not str(entry["message"]).startswith("Error:")
+    ]
+
+DEFAULT_COLLABORATION_ENGINE = CollaborationEngine()
@@ -0,0 +1,116 @@
+# _convergence.py
+import logging
+import re
+
+from _metrics import increment
+
+logger = logging.getLogger(__name__)
+
+CONVERGENCE_WINDOW = 3             # Turns considered when measuring the grade trend and novelty
+MIN_GRADE_IMPROVEMENT = 0.02       # Grade slope per turn below which the grade counts as plateaued
+# Novelty thresholds, calibrated on sample syntheses: paraphrases of the same content score
+# about 0.35-0.5, a follow-up on a related subtopic about 0.75-0.8, an unrelated one above 0.9
+MIN_SYNTHESIS_NOVELTY = 0.6        # Mean novelty below which the synthesis counts as repeating itself
+REPETITION_NOVELTY = 0.2           # A single synthesis this close to a previous one is repetition on its own
+
+_WORD_RE = re.compile(r"[a-z][a-z0-9\-]+")
+_STOPWORDS = frozenset("""
+    the and for with that this these those its from into about than then their there which who whom
+    what when where how while also such can may might will would should could not but are was were
+    been being has have had more most other some any each both between within across over under via
+""".split())
+_SUFFIXES = ("ations", "ation", "ings", "ing", "ities", "ity", "ies", "ed", "es", "ly", "s")
+
+def _stem(word):
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+def _content_words(text):
+    """Lower-cased, crudely stemmed content words; word order is ignored so rewording doesn't look new."""
+    return {_stem(word) for word in _WORD_RE.findall((text or "").lower()) if len(word) > 2 and word not in _STOPWORDS}
+
+def synthesis_novelty(synthesis, previous_syntheses):
+    """
+    Returns 1 - (highest content-word overlap with any previous synthesis), where overlap is
+    the share of the smaller text's content words that the other one also uses.
+    1.0 means entirely new content, 0.0 means the same vocabulary (e.g. a verbatim repeat).
+    """
+    current = _content_words(synthesis)
+    if not current or not previous_syntheses:
+        return 1.0
+    best_similarity = 0.0
+    for previous in previous_syntheses:
+        other = _content_words(previous)
+        if other:
+            best_similarity = max(best_similarity, len(current & other) / min(len(current), len(other)))
+    return 1.0 - best_similarity
+
+def _slope(values):
+    """Least-squares slope of `values` against their index."""
+    n = len(values)
+    if n < 2:
+        return 0.0
+    mean_x = (n - 1) / 2
+    mean_y = sum(values) / n
+    numerator = sum((i - mean_x) * (y - mean_y) for i, y in enumerate(values))
+    denominator = sum((i - mean_x) ** 2 for i in range(n))
+    return numerator / denominator
+
+class ConvergenceMonitor:
+    """
+    Tracks the overall_grade trend and synthesis-to-synthesis novelty across turns
+    and reports when marginal learning has dropped below the configured thresholds.
+    """
+    def __init__(self, window=CONVERGENCE_WINDOW, min_grade_improvement=MIN_GRADE_IMPROVEMENT,
+                 min_synthesis_novelty=MIN_SYNTHESIS_NOVELTY):
+        self.window = window
+        self.min_grade_improvement = min_grade_improvement
+        self.min_synthesis_novelty = min_synthesis_novelty
+        self.grades = []
+        self.syntheses = []
+        self.novelties = []
+        self.turns_observed = 0
+
+    def observe(self, overall_grade, synthesis):
+        """
+        Records one turn and returns a dict with the grade slope, novelty and, if
+        marginal learning has fallen below threshold, `converged=True` plus a reason.
+        """
+        novelty = synthesis_novelty(synthesis, self.syntheses)
+        # Only the last `window` turns are ever compared, so keep nothing older
+        self.syntheses = (self.syntheses + [synthesis])[-self.window:]
+        self.novelties = (self.novelties + [novelty])[-self.window:]
+        if isinstance(overall_grade, (int, float)):
+            self.grades = (self.grades + [float(overall_grade)])[-self.window:]
+        self.turns_observed += 1
+
+        recent_grades = self.grades[-self.window:]
+        recent_novelty = self.novelties[-self.window:]
+        grade_slope = _slope(recent_grades)
+        mean_novelty = sum(recent_novelty) / len(recent_novelty)
+        result = {
+            "grade_slope": round(grade_slope, 4),
+            "synthesis_novelty": round(novelty, 4),
+            "mean_recent_novelty": round(mean_novelty, 4),
+            "converged": False,
+            "reason": None
+        }
+
+        if self.turns_observed > 1 and novelty < REPETITION_NOVELTY:
+            result["converged"] = True
+            result["reason"] = f"synthesis repeats an earlier turn (novelty {novelty:.2f} < {REPETITION_NOVELTY})"
+        elif (len(recent_grades) >= self.window and len(recent_novelty) >= self.window
+              and grade_slope < self.min_grade_improvement and mean_novelty < self.min_synthesis_novelty):
+            result["converged"] = True
+            result["reason"] = (
+                f"grade plateaued (slope {grade_slope:+.3f}/turn < {self.min_grade_improvement}) and "
+                f"synthesis novelty low (mean {mean_novelty:.2f} < {self.min_synthesis_novelty}) "
+                f"over the last {self.window} turns"
+            )
+
+        if result["converged"]:
+            increment("convergence_detected_total")
+            logger.info(f"Convergence detected: {result['reason']}")
+        return result
@@ -2,8 +2,16 @@
 import json
 import logging
 import os
+import textwrap
 from datetime import datetime
 
+from _turn_record import TurnJournal, compact_turn, turn_stub, intern_strings
+
+try:
+    import fcntl # POSIX only; used to keep concurrent worker appends from interleaving
+except ImportError:
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 # Directory for comprehensive session logs (for human review)
@@ -23,28 +31,67 @@ TRAINING_DATA_FILES = {
 }
 
 def initialize_session_log(session_id, initial_topic, super_agent_profile):
-    """Initializes the main session log structure."""
+    """
+    Initializes the main session log structure.
+    Full turn records live in the session's turn journal; "turns" only holds stubs until finalize.
+    """
     return {
-        "session_id": session_id,
+        "session_id": intern_strings(session_id),
         "timestamp_start": datetime.now().isoformat(),
-        "initial_topic": initial_topic,
-        "super_agent_profile_initial": super_agent_profile,
+        "initial_topic": intern_strings(initial_topic),
+        "super_agent_profile_initial": intern_strings(super_agent_profile),
         "turns": []
     }
 
 def finalize_session_log(session_log, super_agent_profile_final):
-    """Adds final details and saves the complete session log."""
+    """
+    Adds final details and saves the complete session log.
+    Turns are streamed from the journal one at a time, so the full log is never held in memory.
+    """
     session_log["timestamp_end"] = datetime.now().isoformat()
     session_log["super_agent_profile_final"] = super_agent_profile_final
     log_filename = os.path.join(SESSION_LOG_DIR, f"{session_log['session_id']}.json")
+    journal = TurnJournal(SESSION_LOG_DIR, session_log["session_id"])
+
     with open(log_filename, "w") as f:
-        json.dump(session_log, f, indent=2)
+        f.write("{")
+        for key, value in session_log.items():
+            if key != "turns":
+                f.write(f"\n  {json.dumps(key)}: {_indent_json(value, 2)},")
+        f.write('\n  "turns": [')
+        for index, turn_record in enumerate(journal.iter_turns()):
+            f.write(("," if index else "") + "\n    " + _indent_json(turn_record, 4))
+        f.write("\n  ]\n}")
+    journal.remove()
     logger.info(f"Session log saved to: {log_filename}")
+    return log_filename
+
+def _indent_json(value, indent):
+    """Pretty-prints `value` for nesting `indent` spaces deep (continuation lines are indented)."""
+    return textwrap.indent(json.dumps(value, indent=2), " " * indent).lstrip()
+
+def _append_jsonl(path, entry):
+    """Appends one JSON line, holding an exclusive lock so parallel workers can share the file."""
+    line = json.dumps(entry) + "\n"
+    with open(path, "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(line)
+            f.flush()
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
 
 
 def add_turn_to_session_log(session_log, turn_data):
-    """Appends a completed turn's data to the session log."""
-    session_log["turns"].append(turn_data)
+    """
+    Spills a completed turn's compact record to the session's turn journal and keeps
+    only a small stub in the session log. Call after the training data has been written.
+    """
+    turn_record = compact_turn(turn_data)
+    TurnJournal(SESSION_LOG_DIR, session_log["session_id"]).append(turn_record)
+    session_log["turns"].append(turn_stub(turn_record))
     logger.debug(f"Turn {turn_data['turn_number']} added to session log.")
 
 def append_training_data_from_turn(turn_data):
@@ -57,7 +104,7 @@ def append_training_data_from_turn(turn_data):
         "turn_number": turn_data["turn_number"],
         "timestamp": turn_data.get("timestamp_turn_end", datetime.now().isoformat()),
         "initial_topic": turn_data["initial_topic"],
-        "super_agent_knowledge_state": turn_data["super_agent_profile_at_turn"].get("current_knowledge_state", "N/A")
+        "super_agent_knowledge_state": turn_data.get("super_agent_knowledge_state", "N/A")
     }
 
     # Synthesis QA
@@ -67,8 +114,7 @@ def append_training_data_from_turn(turn_data):
         "super_agent_synthesis": turn_data["super_agent_synthesis"],
         "meta": metadata
     }
-    with open(TRAINING_DATA_FILES["synthesis_qa"], "a") as f:
-        f.write(json.dumps(synthesis_qa_entry) + "\n")
+    _append_jsonl(TRAINING_DATA_FILES["synthesis_qa"], synthesis_qa_entry)
 
     # Grade Feedback
     if turn_data.get("grade_data"):
@@ -81,8 +127,7 @@ def append_training_data_from_turn(turn_data):
             "grade": turn_data["grade_data"],
             "meta": metadata
         }
-        with open(TRAINING_DATA_FILES["grade_feedback"], "a") as f:
-            f.write(json.dumps(grade_feedback_entry) + "\n")
+        _append_jsonl(TRAINING_DATA_FILES["grade_feedback"], grade_feedback_entry)
 
     # Reflection Feedback
     if turn_data.get("reflection_data"):
@@ -95,8 +140,7 @@ def append_training_data_from_turn(turn_data):
             "reflection": turn_data["reflection_data"],
             "meta": metadata
         }
-        with open(TRAINING_DATA_FILES["reflection_feedback"], "a") as f:
-            f.write(json.dumps(reflection_feedback_entry) + "\n")
+        _append_jsonl(TRAINING_DATA_FILES["reflection_feedback"], reflection_feedback_entry)
 
     # Dream Generation
     if turn_data.get("dream_data") and turn_data["dream_data"].get("dream_ideas"):
@@ -106,8 +150,7 @@ def append_training_data_from_turn(turn_data):
             "dream_ideas": turn_data["dream_data"].get("dream_ideas"),
             "meta": metadata
         }
-        with open(TRAINING_DATA_FILES["dream_generation"], "a") as f:
-            f.write(json.dumps(dream_entry) + "\n")
+        _append_jsonl(TRAINING_DATA_FILES["dream_generation"], dream_entry)
 
     # Collaboration History
     if turn_data.get("collaboration_data"):
@@ -118,5 +161,4 @@ def append_training_data_from_turn(turn_data):
             "super_agent_refined_idea": turn_data["collaboration_data"].get("refined_idea"),
             "meta": metadata
         }
-        with open(TRAINING_DATA_FILES["collaboration_history"], "a") as f:
-            f.write(json.dumps(collab_entry) + "\n")
+        _append_jsonl(TRAINING_DATA_FILES["collaboration_history"], collab_entry)
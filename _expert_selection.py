@@ -0,0 +1,190 @@
+# _expert_selection.py
+import json
+import logging
+import os
+import random
+import re
+import threading
+
+from _metrics import increment
+
+try:
+    import fcntl # POSIX only; serializes read-merge-write of the shared state file across workers
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 2              # Experts queried per turn
+DEFAULT_EXPLORATION_RATE = 0.2 # Chance of a full fan-out turn once every expert has been credited
+MIN_PULLS_PER_EXPERT = 2       # Full fan-out turns per topic/profile that credit every expert before pruning starts
+REWARD_EWMA_ALPHA = 0.3        # Weight of the latest reward in each expert's running value
+
+_WORD_RE = re.compile(r"[a-z][a-z0-9\-]{3,}")
+
+def _apply_reward(arms, name, reward):
+    arm = arms.setdefault(name, {"pulls": 0, "value": reward})
+    arm["pulls"] += 1
+    arm["value"] = REWARD_EWMA_ALPHA * reward + (1 - REWARD_EWMA_ALPHA) * arm["value"]
+
+def _content_words(text):
+    return set(_WORD_RE.findall((text or "").lower()))
+
+def estimate_expert_contributions(expert_responses, super_agent_synthesis, grade_data):
+    """
+    Estimates each queried expert's marginal contribution to the synthesis (0.0-1.0).
+
+    An expert's distinctive terms are the content words no other expert used; the
+    contribution is the share of those terms that made it into the synthesis,
+    scaled by the grader's completeness_score. Failed responses, and experts that
+    added nothing the others did not say, score 0. Returns {} when fewer than two
+    experts answered, since there is nothing to compare against.
+    """
+    synthesis_words = _content_words(super_agent_synthesis)
+    completeness = grade_data.get("completeness_score", 1.0) if grade_data else 1.0
+    if not isinstance(completeness, (int, float)):
+        completeness = 1.0
+
+    words_by_expert = {
+        name: _content_words(response)
+        for name, response in expert_responses.items()
+        if response and not response.startswith("Error:")
+    }
+    if len(words_by_expert) < 2:
+        return {}
+    contributions = {}
+    for name in expert_responses:
+        words = words_by_expert.get(name)
+        if not words:
+            contributions[name] = 0.0
+            continue
+        other_words = set().union(*(w for other, w in words_by_expert.items() if other != name))
+        distinctive = words - other_words
+        if not distinctive:
+            contributions[name] = 0.0
+            continue
+        adopted = len(distinctive & synthesis_words) / len(distinctive)
+        contributions[name] = max(0.0, min(1.0, adopted * completeness))
+    return contributions
+
+class ExpertSelector:
+    """
+    Epsilon-greedy bandit over experts, learned per (topic, super agent profile).
+    Each turn it picks the top-k experts by estimated marginal contribution. Until every
+    expert has been credited a few times, and afterwards with probability
+    `exploration_rate`, it queries every expert instead: only those full fan-out turns
+    compare the experts against each other, so only they update the learned values.
+    """
+    def __init__(self, top_k=DEFAULT_TOP_K, exploration_rate=DEFAULT_EXPLORATION_RATE, state_path=None):
+        self.top_k = top_k
+        self.exploration_rate = exploration_rate
+        self.state_path = state_path
+        self._values = {} # "topic|profile" -> {expert_name: {"pulls": n, "value": ewma reward}}
+        self._pending = [] # (key, expert_name, reward) observed since the last save, replayed onto the file's state
+        self._lock = threading.Lock()
+        if state_path:
+            self._values = self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Could not load expert selection state from {self.state_path}: {e}")
+            return {}
+
+    @staticmethod
+    def _context_key(topic, profile_name):
+        return f"{topic.strip().lower()}|{profile_name}"
+
+    def select(self, expert_llm_clients, topic, profile_name, top_k=None):
+        """
+        Returns the subset of `expert_llm_clients` to query this turn.
+        `top_k` overrides the selector's default for this call (e.g. in a cheaper mode).
+        """
+        top_k = top_k or self.top_k
+        expert_names = list(expert_llm_clients.keys())
+        if not top_k or top_k >= len(expert_names):
+            return dict(expert_llm_clients)
+
+        with self._lock:
+            arms = self._values.get(self._context_key(topic, profile_name), {})
+            under_explored = [n for n in expert_names if arms.get(n, {}).get("pulls", 0) < MIN_PULLS_PER_EXPERT]
+            ranked = sorted(expert_names, key=lambda n: arms.get(n, {}).get("value", 0.0), reverse=True)
+        if under_explored or random.random() < self.exploration_rate:
+            increment("expert_selection_full_fanouts_total")
+            logger.info(f"Expert selection for this turn: all experts {expert_names} (full fan-out to compare them)")
+            return dict(expert_llm_clients)
+
+        chosen = ranked[:top_k]
+        increment("expert_calls_total", len(chosen))
+        increment("expert_calls_saved_total", len(expert_names) - len(chosen))
+        logger.info(f"Expert selection for this turn: {chosen} (skipped: {[n for n in expert_names if n not in chosen]})")
+        return {name: expert_llm_clients[name] for name in chosen}
+
+    def update(self, topic, profile_name, expert_responses, super_agent_synthesis, grade_data, total_experts):
+        """
+        Credits each queried expert with its estimated contribution and tracks grade impact.
+        Experts are only credited on full fan-out turns, where they can be compared against
+        each other; turns whose grading failed are ignored entirely.
+        """
+        if grade_data and grade_data.get("grading_failed"):
+            logger.debug("Grading failed this turn; expert values left unchanged.")
+            return {}
+        full_fanout = len(expert_responses) >= total_experts
+        contributions = (
+            estimate_expert_contributions(expert_responses, super_agent_synthesis, grade_data) if full_fanout else {}
+        )
+        key = self._context_key(topic, profile_name)
+        with self._lock:
+            arms = self._values.setdefault(key, {})
+            for name, reward in contributions.items():
+                _apply_reward(arms, name, reward)
+                self._pending.append((key, name, reward))
+
+        # Grade impact: compare grades of pruned turns against full fan-out turns.
+        overall_grade = grade_data.get("overall_grade") if grade_data else None
+        if isinstance(overall_grade, (int, float)):
+            mode = "full" if full_fanout else "pruned"
+            increment("expert_selection_turns_total", mode=mode)
+            increment("expert_selection_grade_sum", overall_grade, mode=mode)
+        logger.debug(f"Expert contributions this turn: {contributions}")
+        return contributions
+
+    def get_values(self, topic, profile_name):
+        with self._lock:
+            return json.loads(json.dumps(self._values.get(self._context_key(topic, profile_name), {})))
+
+    def save(self):
+        """
+        Persists learned expert values so later sessions on the same topic start informed.
+        Other workers may have saved since this one loaded the file, so the rewards observed
+        here since the last save are replayed onto the file's current state under a lock
+        instead of overwriting it; the merged state then becomes this selector's view.
+        """
+        if not self.state_path:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, []
+        with open(f"{self.state_path}.lock", "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                state = self._load_state()
+                for key, name, reward in pending:
+                    _apply_reward(state.setdefault(key, {}), name, reward)
+                # Write-then-rename so readers never see a half-written state file
+                tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(state, f, indent=2)
+                os.replace(tmp_path, self.state_path)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        with self._lock:
+            # Rewards observed while saving are still pending; apply them on top of the merged state
+            for key, name, reward in self._pending:
+                _apply_reward(state.setdefault(key, {}), name, reward)
+            self._values = state
@@ -0,0 +1,171 @@
+# _http_transport.py
+import logging
+import os
+import threading
+from collections import defaultdict
+import httpx
+
+from _metrics import increment, register_gauge_callback
+
+logger = logging.getLogger(__name__)
+
+# --- Transport Configuration (overridable via .env) ---
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "30"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "30"))
+HTTP_ENABLE_HTTP2 = os.getenv("HTTP_ENABLE_HTTP2", "true").lower() in ("1", "true", "yes")
+
+try:
+    import h2 # noqa: F401 - only needed so httpx can negotiate HTTP/2
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+def build_timeout():
+    """Returns the httpx.Timeout used for every provider call (connect/read/write/pool)."""
+    return httpx.Timeout(
+        connect=HTTP_CONNECT_TIMEOUT,
+        read=HTTP_READ_TIMEOUT,
+        write=HTTP_WRITE_TIMEOUT,
+        pool=HTTP_POOL_TIMEOUT
+    )
+
+class _HostSlotReleasingStream(httpx.SyncByteStream):
+    """Wraps a response stream so the per-host slot is released when the body is closed."""
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        for chunk in self._stream:
+            yield chunk
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+class PooledTransport(httpx.BaseTransport):
+    """
+    httpx transport that keeps a single keep-alive connection pool (HTTP/2 where
+    supported), caps concurrent requests per host and records pool metrics.
+    """
+    def __init__(self, max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST):
+        http2 = HTTP_ENABLE_HTTP2 and _HTTP2_AVAILABLE
+        if HTTP_ENABLE_HTTP2 and not _HTTP2_AVAILABLE:
+            logger.info("HTTP/2 requested but 'h2' is not installed; falling back to HTTP/1.1 keep-alive.")
+        self.http2 = http2
+        self._transport = httpx.HTTPTransport(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+        self._max_per_host = max_connections_per_host
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self._max_per_host))
+        self._in_flight = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _acquire_host_slot(self, host, pool_timeout):
+        with self._lock:
+            slot = self._host_slots[host]
+        if not slot.acquire(blocking=False):
+            # All slots for this host are busy; record the wait so saturation is visible.
+            increment("http_host_slot_waits_total", host=host)
+            if not slot.acquire(timeout=pool_timeout):
+                increment("http_host_slot_timeouts_total", host=host)
+                raise httpx.PoolTimeout(f"Timed out after {pool_timeout}s waiting for a connection slot to {host}")
+        with self._lock:
+            self._in_flight[host] += 1
+
+        released = threading.Event()
+        def release():
+            if released.is_set():
+                return
+            released.set()
+            with self._lock:
+                self._in_flight[host] -= 1
+            slot.release()
+        return release
+
+    def handle_request(self, request):
+        host = request.url.host
+        # Same limit httpx applies to waiting for a pooled connection (the client's pool timeout)
+        pool_timeout = request.extensions.get("timeout", {}).get("pool") or HTTP_POOL_TIMEOUT
+        release = self._acquire_host_slot(host, pool_timeout)
+
+        # httpcore emits trace events per request; a completed TCP connect means
+        # the request could not reuse a pooled keep-alive connection.
+        upstream_trace = request.extensions.get("trace")
+        def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                increment("http_connections_opened_total", host=host)
+            elif event_name == "connection.start_tls.complete":
+                increment("http_tls_handshakes_total", host=host)
+            if upstream_trace:
+                upstream_trace(event_name, info)
+        request.extensions["trace"] = trace
+
+        increment("http_requests_total", host=host)
+        try:
+            response = self._transport.handle_request(request)
+        except Exception:
+            increment("http_request_errors_total", host=host)
+            release()
+            raise
+        response.stream = _HostSlotReleasingStream(response.stream, release)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+    def pool_stats(self):
+        """Returns [(labels, value), ...] describing the connection pool and per-host usage."""
+        stats = []
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+        stats.append(({"state": "total"}, len(connections)))
+        stats.append(({"state": "idle"}, idle))
+        stats.append(({"state": "active"}, len(connections) - idle))
+        with self._lock:
+            for host, count in self._in_flight.items():
+                stats.append(({"state": "in_flight", "host": host}, count))
+        return stats
+
+def get_shared_http_client():
+    """
+    Returns the process-wide pooled httpx.Client shared by every provider client
+    and learning session, creating it on first use.
+    """
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            transport = PooledTransport()
+            _shared_client = httpx.Client(transport=transport, timeout=build_timeout())
+            register_gauge_callback("http_pool_connections", transport.pool_stats)
+            logger.info(
+                f"Shared HTTP client initialized (http2={transport.http2}, "
+                f"max_connections={HTTP_MAX_CONNECTIONS}, per_host={HTTP_MAX_CONNECTIONS_PER_HOST}, "
+                f"connect_timeout={HTTP_CONNECT_TIMEOUT}s, read_timeout={HTTP_READ_TIMEOUT}s)"
+            )
+        return _shared_client
+
+def close_shared_http_client():
+    """Closes the shared client (e.g. on worker shutdown)."""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is not None:
+            _shared_client.close()
+            _shared_client = None
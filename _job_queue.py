@@ -0,0 +1,185 @@
+# _job_queue.py
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_URL = os.getenv("LEARNING_JOB_QUEUE_URL", "sqlite:///learning_jobs.db")
+DEFAULT_MAX_ATTEMPTS = 3
+
+class JobQueueBackend:
+    """
+    Interface for the durable topic-job queue used by worker mode.
+
+    Jobs move queued -> running -> done | failed. A running job is held under a
+    lease that its worker renews with heartbeat(); if the worker dies, the lease
+    expires and the job is re-queued (or failed once max_attempts is reached).
+    """
+    def enqueue(self, topic, super_agent_profile_key=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Adds a topic job and returns its id."""
+        raise NotImplementedError
+
+    def claim(self, worker_id, lease_seconds):
+        """Leases the oldest queued job to `worker_id`; returns the job dict or None."""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        """Extends the lease; returns False if the worker no longer holds the job."""
+        raise NotImplementedError
+
+    def complete(self, job_id, worker_id, result):
+        raise NotImplementedError
+
+    def fail(self, job_id, worker_id, error):
+        """Records a failed attempt, re-queueing the job while attempts remain."""
+        raise NotImplementedError
+
+    def requeue_expired(self):
+        """Re-queues running jobs whose lease has expired; returns how many were touched."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Returns {status: count}."""
+        raise NotImplementedError
+
+class SQLiteJobQueue(JobQueueBackend):
+    """
+    Local durable queue backed by a single SQLite file (WAL mode), safe to share
+    between worker processes on the same machine or a local-lock-capable share.
+    """
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    super_agent_profile_key TEXT,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    worker_id TEXT,
+                    lease_expires_at REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit mode (isolation_level=None); multi-statement updates use BEGIN IMMEDIATE explicitly
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE takes the write lock up front, serializing claimers across processes."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, topic, super_agent_profile_key=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (topic, super_agent_profile_key, max_attempts, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (topic, super_agent_profile_key, max_attempts, now, now)
+            )
+            return cursor.lastrowid
+
+    def _requeue_expired(self, conn, now):
+        # Jobs whose worker stopped heartbeating: retry while attempts remain, otherwise give up
+        failed = conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired', worker_id = NULL, updated_at = ? "
+            "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts",
+            (now, now)
+        ).rowcount
+        requeued = conn.execute(
+            "UPDATE jobs SET status = 'queued', worker_id = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE status = 'running' AND lease_expires_at < ?",
+            (now, now)
+        ).rowcount
+        if failed or requeued:
+            logger.warning(f"Lease expiry: re-queued {requeued} job(s), failed {failed} job(s).")
+        return failed + requeued
+
+    def requeue_expired(self):
+        with self._transaction() as conn:
+            return self._requeue_expired(conn, time.time())
+
+    def claim(self, worker_id, lease_seconds):
+        with self._transaction() as conn:
+            now = time.time()
+            self._requeue_expired(conn, now)
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1, "
+                "lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row["id"])
+            )
+        job = dict(row)
+        job.update({"status": "running", "worker_id": worker_id, "attempts": row["attempts"] + 1})
+        return job
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + lease_seconds, now, job_id, worker_id)
+            ).rowcount
+        return updated == 1
+
+    def complete(self, job_id, worker_id, result):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND worker_id = ?",
+                (json.dumps(result), time.time(), job_id, worker_id)
+            )
+
+    def fail(self, job_id, worker_id, error):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END, "
+                "error = ?, worker_id = NULL, lease_expires_at = NULL, updated_at = ? WHERE id = ? AND worker_id = ?",
+                (error, time.time(), job_id, worker_id)
+            )
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+# Backends by URL scheme; register additional ones (e.g. Redis, Postgres) here
+JOB_QUEUE_BACKENDS = {
+    "sqlite": lambda location: SQLiteJobQueue(location),
+}
+
+def get_job_queue(url=DEFAULT_QUEUE_URL):
+    """Builds a queue backend from a URL such as 'sqlite:///learning_jobs.db'."""
+    scheme, sep, location = url.partition("://")
+    if not sep or scheme not in JOB_QUEUE_BACKENDS:
+        raise ValueError(f"Unsupported job queue URL '{url}'. Known schemes: {sorted(JOB_QUEUE_BACKENDS)}")
+    if scheme == "sqlite" and location.startswith("/"):
+        location = location[1:] or ":memory:" # sqlite:///relative.db and sqlite:////abs/path.db
+    return JOB_QUEUE_BACKENDS[scheme](location)
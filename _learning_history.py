@@ -23,13 +23,18 @@ class LearningHistory:
         """Returns the current learning history."""
         return self.history
 
-    def get_concise_history_for_prompt(self):
+    def get_concise_history_for_prompt(self, pending_turn=None):
         """
         Returns a condensed version of the history suitable for LLM prompts
         to avoid context window limits.
+        If `pending_turn` is given, it is included as if it had already been added
+        (used to build prompts for a speculatively prefetched next turn).
         """
+        turns = self.history
+        if pending_turn is not None:
+            turns = (self.history + [pending_turn])[-self.max_turns:]
         concise_history = []
-        for turn in self.history:
+        for turn in turns:
             concise_turn = {
                 "turn_number": turn.get("turn_number"),
                 "question_asked": turn.get("question_asked", "")[:150] + "...", # Truncate
@@ -1,11 +1,21 @@
 # _learning_modules.py
 import json
 import logging
+import time
 from datetime import datetime
-from _llm_utils import call_llm_with_retry # Our generalized utility
+from _llm_utils import call_llm_with_retry, get_total_tokens, llm_phase # Our generalized utility
+from _model_router import DEFAULT_MODEL_ROUTER
+from _collaboration import DEFAULT_COLLABORATION_ENGINE
+from _structured_output import call_llm_structured
+from _metrics import timed
+from _session_budget import record_expert_latency
 
 logger = logging.getLogger(__name__)
 
+GRADE_SCORE_KEYS = ["relevance_score", "coherence_score", "completeness_score", "depth_score", "novelty_questions_score"]
+BORDERLINE_GRADE_RANGE = (0.4, 0.6)  # Grades in this band are re-checked by a stronger model
+GRADE_CONSISTENCY_TOLERANCE = 0.15   # Max allowed gap between overall_grade and the mean of its criteria
+
 def _format_learning_history_for_prompt(learning_history_data):
     """Formats the learning history for inclusion in LLM prompts."""
     if not learning_history_data:
@@ -21,11 +31,37 @@ def _format_learning_history_for_prompt(learning_history_data):
     formatted_history += "--- End History ---\n\n"
     return formatted_history
 
-def simulate_learning_turn(super_agent_client, expert_llm_clients, topic, current_question, learning_history_for_prompt, super_agent_profile):
+def _validate_grade(grade_data):
+    """Returns (is_valid, is_confident) for a grade payload; borderline or self-inconsistent grades are low confidence."""
+    scores = [grade_data.get(key) for key in GRADE_SCORE_KEYS + ["overall_grade"]]
+    if not all(isinstance(score, float) and 0.0 <= score <= 1.0 for score in scores):
+        return False, False
+    overall_grade = grade_data["overall_grade"]
+    criteria_mean = sum(scores[:-1]) / len(GRADE_SCORE_KEYS)
+    borderline = BORDERLINE_GRADE_RANGE[0] <= overall_grade <= BORDERLINE_GRADE_RANGE[1]
+    inconsistent = abs(overall_grade - criteria_mean) > GRADE_CONSISTENCY_TOLERANCE
+    return True, not (borderline or inconsistent)
+
+def _validate_reflection(reflection_data):
+    is_valid = (
+        isinstance(reflection_data.get("reflection_summary"), str)
+        and isinstance(reflection_data.get("suggested_strategy_adjustments"), dict)
+    )
+    return is_valid, is_valid
+
+def _validate_dream(dream_data):
+    is_valid = isinstance(dream_data.get("dream_ideas"), list) and len(dream_data["dream_ideas"]) > 0
+    return is_valid, is_valid
+
+@timed("learning_phase_latency_seconds", phase="expert_fanout")
+@llm_phase("expert_fanout")
+def query_experts(expert_llm_clients, topic, current_question, learning_history_for_prompt):
     """
-    Orchestrates the querying of expert LLMs and the initial synthesis by the super agent.
+    Queries each expert LLM with the current question.
+    Returns (expert_responses, tokens_used).
     """
     expert_responses = {}
+    tokens_used = 0
     formatted_history = _format_learning_history_for_prompt(learning_history_for_prompt)
 
     logger.info(f"Querying expert LLMs for topic: '{topic}' with question: '{current_question}'")
@@ -34,48 +70,52 @@ def simulate_learning_turn(super_agent_client, expert_llm_clients, topic, curren
         expert_model = config["model"]
         expert_role = config["profile_name"] # Using profile_name as role
 
+        # Static per expert and session (cacheable prefix); the history and question follow it
         prompt = f"""
         You are {expert_role}, an expert on the topic of "{topic}".
         Your role is to provide {config['role']} for the Super Agent.
-
-        {formatted_history}
-
-        The Super Agent is currently learning about "{topic}" and has asked the following question:
-        "{current_question}"
-
+        The Super Agent is learning about "{topic}" and will ask you questions, with a summary of its recent learning history.
         Please provide a concise and informative response from your specialized perspective.
         """
         try:
+            started = time.monotonic()
             response = call_llm_with_retry(
                 expert_client,
                 expert_model,
                 messages=[
                     {"role": "system", "content": prompt.strip()},
-                    {"role": "user", "content": current_question} # The specific question part
+                    {"role": "user", "content": f"{formatted_history}Question: {current_question}"}
                 ],
                 temperature=0.7,
                 max_tokens=500
             )
+            record_expert_latency(expert_name, time.monotonic() - started)
             expert_responses[expert_name] = response.choices[0].message.content
+            tokens_used += get_total_tokens(response)
             logger.debug(f"Received response from {expert_name}")
         except Exception as e:
             logger.error(f"Error getting response from {expert_name}: {e}")
             expert_responses[expert_name] = f"Error: Could not get response from {expert_name}."
 
+    return expert_responses, tokens_used
+
+def simulate_learning_turn(super_agent_client, expert_llm_clients, topic, current_question, learning_history_for_prompt, super_agent_profile, expert_responses=None):
+    """
+    Orchestrates the querying of expert LLMs and the initial synthesis by the super agent.
+    If `expert_responses` is given (e.g. from a speculative prefetch), the expert fan-out is skipped.
+    """
+    formatted_history = _format_learning_history_for_prompt(learning_history_for_prompt)
+    if expert_responses is None:
+        expert_responses, _ = query_experts(expert_llm_clients, topic, current_question, learning_history_for_prompt)
+
     # Super Agent Synthesis
+    # Persona, instructions and schema form a static prefix; per-turn content goes in the user message
     super_agent_synthesis_prompt = f"""
     You are the Super Agent: {super_agent_profile['profile_name']}.
     Your learning style is {super_agent_profile['learning_style']}.
     You are currently learning about the topic: "{topic}".
 
-    {formatted_history}
-
-    You have asked the following question to your expert advisors:
-    "{current_question}"
-
-    Here are their responses:
-    {json.dumps(expert_responses, indent=2)}
-
+    Each turn you ask your expert advisors a question and receive their responses.
     Please synthesize these responses into a coherent understanding of the question.
     Identify any consensus, contradictions, unique insights, and remaining gaps.
     Based on this synthesis and your current understanding, formulate 1-2 new, deeper, and relevant questions
@@ -87,26 +127,33 @@ def simulate_learning_turn(super_agent_client, expert_llm_clients, topic, curren
       "new_questions": ["...", "..."]
     }}
     """
-    try:
-        super_agent_response = call_llm_with_retry(
-            super_agent_client,
-            super_agent_profile["model"], # Super agent uses its own assigned model
-            messages=[
-                {"role": "system", "content": super_agent_synthesis_prompt.strip()},
-                {"role": "user", "content": f"Synthesize and generate next questions for: '{current_question}'"}
-            ],
-            temperature=0.6,
-            max_tokens=1000,
-            response_format={"type": "json_object"}
-        )
-        content = json.loads(super_agent_response.choices[0].message.content)
-        synthesis = content.get("synthesis", "No synthesis provided.")
-        next_questions = content.get("new_questions", [])
-        logger.debug("Super Agent synthesis complete.")
-    except Exception as e:
-        logger.error(f"Error during Super Agent synthesis: {e}")
-        synthesis = f"Error during synthesis: {e}"
-        next_questions = [f"What went wrong during synthesis on {topic}?"]
+    turn_prompt = f"""{formatted_history}You have asked the following question to your expert advisors:
+"{current_question}"
+
+Here are their responses:
+{json.dumps(expert_responses, indent=2)}
+
+Synthesize and generate next questions for: '{current_question}'"""
+    with timed("learning_phase_latency_seconds", phase="synthesis"), llm_phase("synthesis"):
+        try:
+            content, _ = call_llm_structured(
+                super_agent_client,
+                super_agent_profile["model"], # Super agent uses its own assigned model
+                messages=[
+                    {"role": "system", "content": super_agent_synthesis_prompt.strip()},
+                    {"role": "user", "content": turn_prompt}
+                ],
+                schema_name="synthesis",
+                temperature=0.6,
+                max_tokens=1000
+            )
+            synthesis = content["synthesis"]
+            next_questions = content["new_questions"]
+            logger.debug("Super Agent synthesis complete.")
+        except Exception as e:
+            logger.error(f"Error during Super Agent synthesis: {e}")
+            synthesis = f"Error during synthesis: {e}"
+            next_questions = [f"What went wrong during synthesis on {topic}?"]
 
     return {
         "expert_responses": expert_responses,
@@ -114,22 +161,20 @@ def simulate_learning_turn(super_agent_client, expert_llm_clients, topic, curren
         "next_questions_for_experts": next_questions
     }
 
-def grade_learning_turn(super_agent_client, topic, current_question, expert_responses, super_agent_synthesis, next_questions, learning_history_for_prompt):
+@timed("learning_phase_latency_seconds", phase="grading")
+@llm_phase("grading")
+def grade_learning_turn(super_agent_client, topic, current_question, expert_responses, super_agent_synthesis, next_questions, learning_history_for_prompt, model_router=None):
     """
     Quantitatively assesses the quality of the super agent's understanding, synthesis, and generated questions.
+    Starts on a fast model and escalates when the grade is invalid or borderline.
     """
+    model_router = model_router or DEFAULT_MODEL_ROUTER
     formatted_history = _format_learning_history_for_prompt(learning_history_for_prompt)
 
     prompt = f"""
     You are a dedicated grader for the Super Agent's learning process.
-    Your task is to evaluate the Super Agent's performance on the following turn related to "{topic}".
-
-    {formatted_history}
-
-    Original Question asked by Super Agent: "{current_question}"
-    Expert Responses: {json.dumps(expert_responses, indent=2)}
-    Super Agent's Synthesis: "{super_agent_synthesis}"
-    Super Agent's Next Questions: {json.dumps(next_questions)}
+    Your task is to evaluate the Super Agent's performance on a learning turn related to "{topic}".
+    The turn (question, expert responses, synthesis and next questions) follows in the user message.
 
     Rate the following criteria on a scale of 0.0 to 1.0, and provide a brief reasoning:
     1.  **Relevance (to original question & topic)**: How well did the synthesis address the original question and the overall topic?
@@ -151,47 +196,46 @@ def grade_learning_turn(super_agent_client, topic, current_question, expert_resp
       "grade_reasoning": "A brief explanation of the overall grade."
     }}
     """
+    turn_prompt = f"""{formatted_history}Original Question asked by Super Agent: "{current_question}"
+Expert Responses: {json.dumps(expert_responses, indent=2)}
+Super Agent's Synthesis: "{super_agent_synthesis}"
+Super Agent's Next Questions: {json.dumps(next_questions)}"""
     logger.info("Grading Super Agent's turn...")
-    try:
-        response = call_llm_with_retry(
+    def _grade_with(model):
+        grade_data, _ = call_llm_structured(
             super_agent_client, # Super agent grades itself, or use a dedicated grader LLM
-            "gpt-3.5-turbo-0125", # A standard, reliable model for grading
-            messages=[{"role": "system", "content": prompt}],
+            model,
+            messages=[{"role": "system", "content": prompt}, {"role": "user", "content": turn_prompt}],
+            schema_name="grade", # Scores are coerced to floats by the schema
             temperature=0.1, # Keep it deterministic for grading
-            max_tokens=400,
-            response_format={"type": "json_object"}
+            max_tokens=400
         )
-        grade_data = json.loads(response.choices[0].message.content)
-        # Ensure scores are floats
-        for key in grade_data:
-            if "_score" in key and isinstance(grade_data[key], (int, float)):
-                grade_data[key] = float(grade_data[key])
         return grade_data
+
+    try:
+        return model_router.run("grading", _grade_with, _validate_grade)
     except Exception as e:
         logger.error(f"Error during grading: {e}")
         return {
             "relevance_score": 0.0, "coherence_score": 0.0, "completeness_score": 0.0,
             "depth_score": 0.0, "novelty_questions_score": 0.0, "overall_grade": 0.0,
-            "grade_reasoning": f"Grading failed: {e}"
+            "grade_reasoning": f"Grading failed: {e}",
+            "grading_failed": True # Placeholder scores: not a real grade of the turn
         }
 
-def reflect_on_learning_turn(super_agent_client, topic, turn_data, grade_data, learning_history_for_prompt):
+@timed("learning_phase_latency_seconds", phase="reflection")
+@llm_phase("reflection")
+def reflect_on_learning_turn(super_agent_client, topic, turn_data, grade_data, learning_history_for_prompt, model_router=None):
     """
     Qualitatively analyzes the learning process, identifying strengths, weaknesses, and potential improvements.
     """
+    model_router = model_router or DEFAULT_MODEL_ROUTER
     formatted_history = _format_learning_history_for_prompt(learning_history_for_prompt)
     
     prompt = f"""
     You are the Super Agent's internal reflection module.
     Analyze the learning process for the current turn on topic "{topic}", considering the grade received.
-
-    {formatted_history}
-
-    Turn Details:
-    Question Asked: "{turn_data['question_asked']}"
-    Super Agent Synthesis: "{turn_data['super_agent_synthesis']}"
-    Grade Data: {json.dumps(grade_data, indent=2)}
-    Expert Responses: {json.dumps(turn_data['expert_responses'], indent=2)}
+    The turn details follow in the user message.
 
     Based on this, provide a concise reflection:
     1.  What went well in this learning turn?
@@ -209,17 +253,25 @@ def reflect_on_learning_turn(super_agent_client, topic, turn_data, grade_data, l
       }}
     }}
     """
+    turn_prompt = f"""{formatted_history}Turn Details:
+Question Asked: "{turn_data['question_asked']}"
+Super Agent Synthesis: "{turn_data['super_agent_synthesis']}"
+Grade Data: {json.dumps(grade_data, indent=2)}
+Expert Responses: {json.dumps(turn_data['expert_responses'], indent=2)}"""
     logger.info("Reflecting on Super Agent's turn...")
-    try:
-        response = call_llm_with_retry(
+    def _reflect_with(model):
+        reflection_data, _ = call_llm_structured(
             super_agent_client,
-            "gpt-3.5-turbo-0125", # A standard, reliable model for reflection
-            messages=[{"role": "system", "content": prompt}],
+            model,
+            messages=[{"role": "system", "content": prompt}, {"role": "user", "content": turn_prompt}],
+            schema_name="reflection",
             temperature=0.3, # Allow some creativity but keep it grounded
-            max_tokens=500,
-            response_format={"type": "json_object"}
+            max_tokens=500
         )
-        return json.loads(response.choices[0].message.content)
+        return reflection_data
+
+    try:
+        return model_router.run("reflection", _reflect_with, _validate_reflection)
     except Exception as e:
         logger.error(f"Error during reflection: {e}")
         return {
@@ -228,10 +280,13 @@ def reflect_on_learning_turn(super_agent_client, topic, turn_data, grade_data, l
             "suggested_strategy_adjustments": {}
         }
 
-def dream_about_topic(super_agent_client, topic, current_understanding_summary, learning_history_for_prompt, dreaming_tendency):
+@timed("learning_phase_latency_seconds", phase="dreaming")
+@llm_phase("dreaming")
+def dream_about_topic(super_agent_client, topic, current_understanding_summary, learning_history_for_prompt, dreaming_tendency, model_router=None):
     """
     Encourages the super agent to generate novel ideas, hypothetical scenarios, or future implications.
     """
+    model_router = model_router or DEFAULT_MODEL_ROUTER
     if dreaming_tendency == "low":
         logger.info("Dreaming tendency is low, skipping dreaming phase.")
         return {"dream_ideas": [], "dream_summary": "Dreaming tendency low."}
@@ -240,10 +295,7 @@ def dream_about_topic(super_agent_client, topic, current_understanding_summary,
 
     prompt = f"""
     You are the Super Agent. Your current dreaming tendency is {dreaming_tendency}.
-    Based on your current understanding of "{topic}":
-    "{current_understanding_summary}"
-
-    {formatted_history}
+    Your current understanding of "{topic}" follows in the user message.
 
     Generate 3-5 entirely new, speculative, or creative ideas, applications, challenges, or future directions related to this topic.
     Think broadly and interdisciplinarily. Don't just summarize; extrapolate, hypothesize, or imagine.
@@ -258,122 +310,36 @@ def dream_about_topic(super_agent_client, topic, current_understanding_summary,
       "dream_summary": "A brief summary of the ideas generated."
     }}
     """
+    turn_prompt = f"""{formatted_history}Current understanding of "{topic}":
+"{current_understanding_summary}\""""
     logger.info("Super Agent is dreaming...")
-    try:
-        response = call_llm_with_retry(
+    def _dream_with(model):
+        dream_data, _ = call_llm_structured(
             super_agent_client,
-            "gpt-3.5-turbo-0125", # Consider a more creative model if available (e.g., gemini-1.5-pro or gpt-4o)
-            messages=[{"role": "system", "content": prompt}],
+            model,
+            messages=[{"role": "system", "content": prompt}, {"role": "user", "content": turn_prompt}],
+            schema_name="dream",
             temperature=0.9, # High temperature for creativity
-            max_tokens=600,
-            response_format={"type": "json_object"}
+            max_tokens=600
         )
-        return json.loads(response.choices[0].message.content)
+        return dream_data
+
+    try:
+        return model_router.run("dreaming", _dream_with, _validate_dream)
     except Exception as e:
         logger.error(f"Error during dreaming: {e}")
         return {"dream_ideas": [], "dream_summary": f"Dreaming failed: {e}"}
 
-def collaborate_on_ideas(super_agent_client, expert_llm_clients, topic, initial_idea, collaboration_style, expert_profiles):
+@timed("learning_phase_latency_seconds", phase="collaboration")
+@llm_phase("collaboration")
+def collaborate_on_ideas(super_agent_client, expert_llm_clients, topic, initial_idea, collaboration_style, expert_profiles, super_agent_model, engine=None):
     """
     Facilitates a collaborative brainstorming/refinement session between the super agent and selected expert LLMs.
+    Experts debate concurrently over several rounds (see _collaboration.py) and the super agent
+    synthesizes the outcome with `super_agent_model`.
     """
-    logger.info(f"Super Agent initiating collaboration on idea: '{initial_idea}'")
-
-    expert_feedback = {}
-    collaboration_log = []
-
-    # Super Agent sets the collaboration context
-    sa_collaboration_prompt = f"""
-    You are the Super Agent. You are initiating a collaborative discussion on the topic "{topic}".
-    The idea we are exploring is: "{initial_idea}"
-    Your collaboration style is: {collaboration_style}.
-
-    I will share this idea with the expert advisors. Please prepare to synthesize their feedback
-    and refine the idea or formulate new questions based on their input.
-    """
-    # Simulate initial prompt from SA to experts (no direct API call, just setting the stage)
-    collaboration_log.append({"speaker": "Super Agent (Initiator)", "message": sa_collaboration_prompt})
-
-    # Experts provide feedback based on their collaboration mode
-    for expert_name, config in expert_llm_clients.items():
-        expert_client = config["client"]
-        expert_model = config["model"]
-        expert_profile = expert_profiles.get(expert_name, {}) # Get full profile for collaboration mode
-        expert_collaboration_mode = expert_profile.get("collaboration_mode", "general feedback")
-
-        expert_prompt = f"""
-        You are {expert_profile.get('profile_name', expert_name)}. Your role is {expert_profile.get('role', 'an expert')}.
-        The Super Agent has proposed an idea for collaboration on the topic "{topic}":
-        "{initial_idea}"
-
-        Your collaboration mode is: "{expert_collaboration_mode}".
-        Please provide your feedback, critique, alternative perspectives, or suggestions for refinement based on your expertise and collaboration mode.
-        """
-        try:
-            response = call_llm_with_retry(
-                expert_client,
-                expert_model,
-                messages=[
-                    {"role": "system", "content": expert_prompt},
-                    {"role": "user", "content": f"Provide feedback on the idea: '{initial_idea}'"}
-                ],
-                temperature=0.7,
-                max_tokens=400
-            )
-            feedback = response.choices[0].message.content
-            expert_feedback[expert_name] = feedback
-            collaboration_log.append({"speaker": expert_name, "message": feedback})
-            logger.debug(f"Received collaboration feedback from {expert_name}")
-        except Exception as e:
-            logger.error(f"Error getting collaboration feedback from {expert_name}: {e}")
-            expert_feedback[expert_name] = f"Error: Could not get feedback from {expert_name}."
-            collaboration_log.append({"speaker": expert_name, "message": f"Error: {e}"})
-
-    # Super Agent synthesizes collaboration feedback
-    sa_synthesis_collab_prompt = f"""
-    You are the Super Agent. You have received feedback from your expert advisors on the idea:
-    "{initial_idea}"
-
-    Expert Feedback: {json.dumps(expert_feedback, indent=2)}
-
-    Based on this feedback and your {collaboration_style} style, please:
-    1.  Refine the initial idea.
-    2.  Summarize the key takeaways from the collaboration.
-    3.  Formulate 1-2 new questions that emerged from this collaborative discussion for further learning.
-
-    Return ONLY a JSON object:
-    {{
-      "refined_idea": "...",
-      "summary": "...",
-      "new_questions": ["...", "..."]
-    }}
-    """
-    try:
-        sa_collab_response = call_llm_with_retry(
-            super_agent_client,
-            super_agent_client.models[0].id if hasattr(super_agent_client, 'models') else "gpt-3.5-turbo-0125", # Fallback for OpenAI
-            messages=[{"role": "system", "content": sa_synthesis_collab_prompt}],
-            temperature=0.5,
-            max_tokens=800,
-            response_format={"type": "json_object"}
-        )
-        collab_result = json.loads(sa_collab_response.choices[0].message.content)
-        collaboration_log.append({"speaker": "Super Agent (Synthesis)", "message": collab_result})
-        logger.debug("Super Agent collaboration synthesis complete.")
-    except Exception as e:
-        logger.error(f"Error during Super Agent collaboration synthesis: {e}")
-        collab_result = {
-            "refined_idea": f"Collaboration failed: {e}",
-            "summary": "Failed to synthesize collaboration feedback.",
-            "new_questions": []
-        }
-        collaboration_log.append({"speaker": "Super Agent (Error)", "message": f"Error: {e}"})
-
-    return {
-        "initial_idea": initial_idea,
-        "expert_feedback": expert_feedback,
-        "refined_idea": collab_result.get("refined_idea"),
-        "summary": collab_result.get("summary"),
-        "new_questions": collab_result.get("new_questions"),
-        "collaboration_log": collaboration_log # Store the back-and-forth
-    }
+    engine = engine or DEFAULT_COLLABORATION_ENGINE
+    return engine.run(
+        super_agent_client, super_agent_model, expert_llm_clients, topic, initial_idea,
+        collaboration_style, expert_profiles
+    )
@@ -1,11 +1,17 @@
+import contextvars
 import logging
 import os
+import time
+from contextlib import contextmanager
 from openai import OpenAI
 import google.generativeai as genai
 # import anthropic # Uncomment if you use Anthropic Claude
 # from groq import Groq # Uncomment if you use Groq for Llama/Mixtral
 from tenacity import retry, wait_exponential, stop_after_attempt, before_sleep_log, RetryError
 
+from _metrics import increment, observe
+from _session_budget import record_llm_usage, apply_max_tokens_budget
+
 logger = logging.getLogger(__name__)
 
 # Configure Google Gemini (assuming API key is set in .env)
@@ -18,10 +24,37 @@ genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 # anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 # groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
+# Learning phase that LLM calls in the current context belong to (for per-phase usage/cache accounting)
+_current_phase = contextvars.ContextVar("llm_phase", default="other")
+
+@contextmanager
+def llm_phase(name):
+    """Attributes LLM calls made inside the block (or decorated function) to phase `name`."""
+    token = _current_phase.set(name)
+    try:
+        yield
+    finally:
+        _current_phase.reset(token)
+
+def _provider_name(llm_client_instance):
+    """Short provider label used in metrics."""
+    if isinstance(llm_client_instance, OpenAI):
+        return "openai"
+    if isinstance(llm_client_instance, genai.GenerativeModel):
+        return "gemini"
+    return type(llm_client_instance).__name__.lower()
+
+_log_before_sleep = before_sleep_log(logger, logging.DEBUG)
+
+def _count_retry(retry_state):
+    """tenacity before_sleep hook: logs and counts each retry per provider."""
+    increment("llm_retries_total", provider=_provider_name(retry_state.args[0]))
+    _log_before_sleep(retry_state)
+
 @retry(
     wait=wait_exponential(multiplier=1, min=4, max=10),
     stop=stop_after_attempt(5),
-    before_sleep=before_sleep_log(logger, logging.DEBUG))
+    before_sleep=_count_retry)
 def _call_llm_api_core(llm_client_instance, model, messages, temperature, max_tokens, response_format=None, **kwargs):
     """
     Internal function for direct LLM API call, decorated with tenacity.
@@ -51,20 +84,21 @@ def _call_llm_api_core(llm_client_instance, model, messages, temperature, max_to
         elif isinstance(llm_client_instance, genai.GenerativeModel):
             # Gemini has different message structure and response format handling
             gemini_messages = [{"role": "user" if m["role"] == "user" else "model", "parts": [m["content"]]} for m in messages]
-            # Gemini response_format is implicit or handled via specific tools/schemas
-            # For JSON output, we often rely on prompt instruction and then parse
+            # Map OpenAI-style JSON mode onto Gemini's JSON response MIME type
+            wants_json = bool(response_format) and response_format.get("type") == "json_object"
             response = llm_client_instance.generate_content(
                 gemini_messages,
                 generation_config=genai.types.GenerationConfig(
                     candidate_count=1,
                     temperature=temperature,
                     max_output_tokens=max_tokens,
-                    # response_mime_type="application/json" # This can be used if available and desired
+                    response_mime_type="application/json" if wants_json else None
                 ),
                 **kwargs
             )
             # Gemini's response structure is different, we need to adapt it
-            # Simulate OpenAI's choices[0].message.content
+            # Simulate OpenAI's choices[0].message.content and usage
+            usage_metadata = getattr(response, "usage_metadata", None)
             return type('obj', (object,), {
                 'choices': [
                     type('obj', (object,), {
@@ -72,7 +106,15 @@ def _call_llm_api_core(llm_client_instance, model, messages, temperature, max_to
                             'content': response.text
                         })
                     })
-                ]
+                ],
+                'usage': type('obj', (object,), {
+                    'prompt_tokens': getattr(usage_metadata, "prompt_token_count", 0) or 0,
+                    'completion_tokens': getattr(usage_metadata, "candidates_token_count", 0) or 0,
+                    'total_tokens': getattr(usage_metadata, "total_token_count", 0) or 0,
+                    'prompt_tokens_details': type('obj', (object,), {
+                        'cached_tokens': getattr(usage_metadata, "cached_content_token_count", 0) or 0
+                    })
+                })
             })
         # Add other LLM clients (Anthropic, Groq, etc.) here
         # elif isinstance(llm_client_instance, anthropic.Anthropic):
@@ -90,9 +132,44 @@ def call_llm_with_retry(llm_client_instance, model, messages, temperature, max_t
     """
     Wrapper for LLM API calls with retry logic, handling RetryError explicitly.
     Accepts client_instance as an argument.
+    Records per-provider call/error counts, latency and token usage.
     """
+    provider = _provider_name(llm_client_instance)
+    max_tokens = apply_max_tokens_budget(max_tokens) # Shorter outputs when the session budget runs low
+    increment("llm_calls_total", provider=provider, model=model)
+    start = time.monotonic()
     try:
-        return _call_llm_api_core(llm_client_instance, model, messages, temperature, max_tokens, response_format, **kwargs)
+        response = _call_llm_api_core(llm_client_instance, model, messages, temperature, max_tokens, response_format, **kwargs)
     except RetryError as e:
+        increment("llm_call_errors_total", provider=provider, model=model)
         logger.error(f"LLM API call failed after multiple retries: {e}")
         raise ConnectionError("Failed to connect to LLM API after multiple retries.") from e
+    finally:
+        observe("llm_call_latency_seconds", time.monotonic() - start, provider=provider)
+
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    cached_tokens = get_cached_prompt_tokens(response)
+    phase = _current_phase.get()
+    increment("llm_tokens_total", prompt_tokens, provider=provider, kind="prompt")
+    increment("llm_tokens_total", completion_tokens, provider=provider, kind="completion")
+    increment("llm_prompt_tokens_by_phase_total", prompt_tokens, provider=provider, phase=phase)
+    increment("llm_cached_prompt_tokens_total", cached_tokens, provider=provider, phase=phase)
+    # Charge the active session budget, if any
+    record_llm_usage(model, prompt_tokens, completion_tokens, cached_tokens=cached_tokens, phase=phase)
+    return response
+
+def get_total_tokens(response):
+    """Returns the total token count reported by a (normalized) LLM response, or 0 if unavailable."""
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", 0) or 0
+
+def get_cached_prompt_tokens(response):
+    """
+    Returns how many prompt tokens the provider served from its prompt-prefix cache
+    (OpenAI usage.prompt_tokens_details.cached_tokens; Gemini's cached_content_token_count
+    is mapped onto the same field by the adapter), or 0 if unreported.
+    """
+    details = getattr(getattr(response, "usage", None), "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", 0) or 0
@@ -0,0 +1,181 @@
+# _metrics.py
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Optional Prometheus endpoint; set METRICS_PORT in .env to enable it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+# A tiny in-process metrics registry shared by the learning modules.
+# Metrics are keyed by (name, sorted label items) so the same metric can carry
+# per-provider / per-host / per-phase labels.
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_gauge_callbacks = {} # name -> callable returning {labels_tuple: value}
+_histograms = {} # (name, labels) -> {"buckets": (...), "counts": [...], "sum": float, "count": int}
+
+_metrics_server = None
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def increment(name, value=1, **labels):
+    """Increments a monotonically increasing counter."""
+    with _lock:
+        _counters[(name, _label_key(labels))] += value
+
+def set_gauge(name, value, **labels):
+    """Sets a point-in-time gauge value."""
+    with _lock:
+        _gauges[(name, _label_key(labels))] = value
+
+def add_to_gauge(name, delta, **labels):
+    """Adjusts a gauge up or down (e.g. sessions in flight)."""
+    with _lock:
+        key = (name, _label_key(labels))
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+def observe(name, value, buckets=DEFAULT_LATENCY_BUCKETS, **labels):
+    """Records one observation in a cumulative histogram."""
+    with _lock:
+        key = (name, _label_key(labels))
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = {"buckets": tuple(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            _histograms[key] = histogram
+        for i, upper_bound in enumerate(histogram["buckets"]):
+            if value <= upper_bound:
+                histogram["counts"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+@contextmanager
+def timed(name, **labels):
+    """Context manager that observes the wall-clock duration of its block in seconds."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - start, **labels)
+
+def register_gauge_callback(name, callback):
+    """
+    Registers a callable that is evaluated on every snapshot.
+    The callable returns a list of (labels_dict, value) tuples.
+    Useful for values that live elsewhere (e.g. connection pool state).
+    """
+    with _lock:
+        _gauge_callbacks[name] = callback
+
+def _collect():
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        callbacks = dict(_gauge_callbacks)
+        histograms = {key: {**h, "counts": list(h["counts"])} for key, h in _histograms.items()}
+
+    for name, callback in callbacks.items():
+        try:
+            for labels, value in callback():
+                gauges[(name, _label_key(labels))] = value
+        except Exception as e:
+            logger.debug(f"Gauge callback '{name}' failed: {e}")
+    return counters, gauges, histograms
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escape = lambda v: v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in items) + "}"
+
+def snapshot():
+    """Returns a plain-dict copy of all metrics, suitable for logging or JSON export."""
+    counters, gauges, histograms = _collect()
+
+    def _flatten(metrics):
+        return {name + _format_labels(labels): value for (name, labels), value in sorted(metrics.items())}
+
+    return {
+        "counters": _flatten(counters),
+        "gauges": _flatten(gauges),
+        "histograms": {
+            name + _format_labels(labels): {"count": h["count"], "sum": round(h["sum"], 4)}
+            for (name, labels), h in sorted(histograms.items())
+        }
+    }
+
+def get_counter(name, **labels):
+    """Returns the current value of a single counter (0 if never incremented)."""
+    with _lock:
+        return _counters.get((name, _label_key(labels)), 0.0)
+
+def render_prometheus():
+    """Renders every metric in the Prometheus text exposition format (version 0.0.4)."""
+    counters, gauges, histograms = _collect()
+    lines = []
+
+    def _emit(metrics, metric_type):
+        seen = set()
+        for (name, labels), value in sorted(metrics.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} {metric_type}")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {float(value)}")
+
+    _emit(counters, "counter")
+    _emit(gauges, "gauge")
+
+    seen = set()
+    for (name, labels), h in sorted(histograms.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        for upper_bound, count in zip(h["buckets"], h["counts"]):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(float(upper_bound)))])} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {h['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {h['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics endpoint: " + format % args)
+
+def start_metrics_server(port, host=METRICS_HOST):
+    """Serves /metrics on a daemon thread; calling it again returns the running server."""
+    global _metrics_server
+    with _lock:
+        if _metrics_server is not None:
+            return _metrics_server
+        _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=_metrics_server.serve_forever, name="metrics-endpoint", daemon=True).start()
+    logger.info(f"Prometheus metrics available at http://{host}:{port}/metrics")
+    return _metrics_server
+
+def maybe_start_metrics_server(port_offset=0):
+    """Starts the endpoint if METRICS_PORT is configured (offset lets worker processes share a base port)."""
+    if METRICS_PORT:
+        return start_metrics_server(int(METRICS_PORT) + port_offset)
+    return None
@@ -0,0 +1,128 @@
+# _model_router.py
+import logging
+import random
+import threading
+import time
+
+from _metrics import increment, set_gauge
+
+logger = logging.getLogger(__name__)
+
+# Models within a tier are considered interchangeable; the router picks among them
+# using observed latency and error rate. Tiers are ordered cheapest/fastest first.
+MODEL_TIERS = {
+    "fast": ["gpt-3.5-turbo-0125", "gpt-4o-mini"],
+    "strong": ["gpt-4o"],
+}
+
+# Which tiers each phase may use, in escalation order.
+PHASE_CASCADES = {
+    "grading": ["fast", "strong"],
+    "reflection": ["fast", "strong"],
+    "dreaming": ["fast", "strong"],
+}
+
+EWMA_ALPHA = 0.3          # Weight of the newest observation
+ERROR_PENALTY = 4.0       # How strongly the error rate inflates a model's effective latency
+EXPLORATION_RATE = 0.05   # Occasionally try a non-best model so stale stats can recover
+
+class ModelRouter:
+    """
+    Routes a phase's LLM call through a cascade of model tiers.
+    The cheapest tier is tried first; the call escalates to the next tier only when
+    the output fails validation or the validator reports low confidence.
+    """
+    def __init__(self, model_tiers=None, phase_cascades=None, exploration_rate=EXPLORATION_RATE):
+        self.model_tiers = model_tiers or MODEL_TIERS
+        self.phase_cascades = phase_cascades or PHASE_CASCADES
+        self.exploration_rate = exploration_rate
+        self._stats = {} # model -> {"latency": ewma seconds, "error_rate": ewma, "calls": n}
+        self._lock = threading.Lock()
+
+    def _effective_latency(self, model):
+        stats = self._stats.get(model)
+        if not stats:
+            return 0.0 # Unobserved models are tried first
+        return stats["latency"] * (1 + ERROR_PENALTY * stats["error_rate"])
+
+    def rank_models(self, tier):
+        """Returns the tier's models ordered best-first by EWMA latency and error rate."""
+        models = list(self.model_tiers.get(tier, []))
+        with self._lock:
+            ranked = sorted(models, key=self._effective_latency)
+        if len(ranked) > 1 and random.random() < self.exploration_rate:
+            explore = random.choice(ranked[1:])
+            ranked.remove(explore)
+            ranked.insert(0, explore)
+        return ranked
+
+    def record(self, model, latency, error):
+        """Folds one observation into the model's EWMA latency and error rate."""
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                stats = {"latency": latency, "error_rate": 1.0 if error else 0.0, "calls": 0}
+                self._stats[model] = stats
+            else:
+                if not error:
+                    stats["latency"] = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * stats["latency"]
+                stats["error_rate"] = EWMA_ALPHA * (1.0 if error else 0.0) + (1 - EWMA_ALPHA) * stats["error_rate"]
+            stats["calls"] += 1
+            set_gauge("model_router_ewma_latency_seconds", stats["latency"], model=model)
+            set_gauge("model_router_ewma_error_rate", stats["error_rate"], model=model)
+
+    def get_stats(self):
+        with self._lock:
+            return {model: dict(stats) for model, stats in self._stats.items()}
+
+    def run(self, phase, call_fn, validate_fn):
+        """
+        Executes `call_fn(model)` through the phase's cascade.
+
+        `validate_fn(result)` returns (is_valid, is_confident). A call that raises is
+        retried on the next equivalent model in the same tier. An invalid or
+        low-confidence result escalates to the next tier; the low-confidence
+        result is kept as a fallback if no stronger tier does better.
+        Raises the last error if no model produced a valid result.
+        """
+        tiers = self.phase_cascades.get(phase, ["fast", "strong"])
+        best_valid_result = None
+        last_error = None
+
+        for tier_index, tier in enumerate(tiers):
+            is_last_tier = tier_index == len(tiers) - 1
+            for model in self.rank_models(tier):
+                start = time.monotonic()
+                try:
+                    result = call_fn(model)
+                except Exception as e:
+                    self.record(model, time.monotonic() - start, error=True)
+                    increment("model_router_call_errors_total", phase=phase, model=model)
+                    logger.warning(f"[{phase}] {model} failed: {e}")
+                    last_error = e
+                    continue
+                self.record(model, time.monotonic() - start, error=False)
+                increment("model_router_calls_total", phase=phase, model=model)
+
+                is_valid, is_confident = validate_fn(result)
+                if not is_valid:
+                    increment("model_router_invalid_outputs_total", phase=phase, model=model)
+                    logger.warning(f"[{phase}] {model} returned output that failed validation.")
+                    last_error = ValueError(f"{model} returned invalid output for {phase}")
+                    break
+                if is_confident or is_last_tier:
+                    logger.debug(f"[{phase}] served by {model} (tier '{tier}').")
+                    return result
+                # Valid but low confidence: keep it as a fallback and try a stronger tier.
+                best_valid_result = result
+                break
+
+            if not is_last_tier:
+                increment("model_router_escalations_total", phase=phase, from_tier=tier)
+                logger.info(f"[{phase}] Escalating from '{tier}' tier to '{tiers[tier_index + 1]}'.")
+
+        if best_valid_result is not None:
+            return best_valid_result
+        raise last_error or RuntimeError(f"No model available for phase '{phase}'")
+
+DEFAULT_MODEL_ROUTER = ModelRouter()
@@ -0,0 +1,221 @@
+# _session_budget.py
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from _metrics import increment
+
+logger = logging.getLogger(__name__)
+
+# USD per 1K tokens (prompt, completion); used only for budget accounting
+MODEL_PRICES_PER_1K_TOKENS = {
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo-0125": (0.0005, 0.0015),
+    "gemini-1.5-flash": (0.000075, 0.0003),
+    "gemini-1.5-pro": (0.00125, 0.005),
+}
+DEFAULT_PRICE_PER_1K_TOKENS = (0.005, 0.015) # Assume an expensive model when the price is unknown
+CACHED_PROMPT_PRICE_FACTOR = 0.5 # Prompt tokens served from the provider's prefix cache are billed at a discount
+
+# Policy thresholds, as a fraction of the tightest budget consumed
+SHED_OPTIONAL_PHASES_AT = 0.7 # Skip dreaming/collaboration
+REDUCE_OUTPUT_AT = 0.85       # Lower max_tokens and drop slow experts
+REDUCED_MAX_TOKENS_SCALE = 0.6
+MIN_MAX_TOKENS = 200
+SLOW_EXPERT_FACTOR = 1.5      # An expert this much slower than the fastest counts as slow
+EXPERT_LATENCY_EWMA_ALPHA = 0.3
+
+_active_budget = contextvars.ContextVar("active_session_budget", default=None)
+
+class SessionBudget:
+    """
+    Wall-clock, token and cost envelope for one learning session.
+    LLM usage is charged automatically while the budget is active (see activate()),
+    and evaluate() turns the consumption so far into a shedding policy.
+    """
+    def __init__(self, time_budget_seconds=None, token_budget=None, cost_budget_usd=None):
+        self.time_budget_seconds = time_budget_seconds
+        self.token_budget = token_budget
+        self.cost_budget_usd = cost_budget_usd
+        self.started_at = time.monotonic()
+        self._paused_seconds = 0.0 # Time excluded from the time budget (see paused())
+        self.tokens_used = 0
+        self.cost_used_usd = 0.0
+        self.expert_latency = {} # expert name -> EWMA seconds
+        self.usage_by_phase = {} # phase -> {"calls", "prompt_tokens", "cached_prompt_tokens", "completion_tokens"}
+        self.max_tokens_scale = 1.0 # Applied to every LLM call's max_tokens while active
+        self._turn_marks = [] # (elapsed, tokens, cost) at the end of each turn
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return any(limit is not None for limit in (self.time_budget_seconds, self.token_budget, self.cost_budget_usd))
+
+    @contextmanager
+    def activate(self):
+        """Makes this the budget charged by LLM calls in the current context."""
+        token = _active_budget.set(self)
+        try:
+            yield self
+        finally:
+            _active_budget.reset(token)
+
+    def charge(self, model, prompt_tokens, completion_tokens, cached_tokens=0, phase="other"):
+        prompt_price, completion_price = MODEL_PRICES_PER_1K_TOKENS.get(model, DEFAULT_PRICE_PER_1K_TOKENS)
+        billed_prompt_tokens = prompt_tokens - cached_tokens + cached_tokens * CACHED_PROMPT_PRICE_FACTOR
+        cost = (billed_prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+        with self._lock:
+            self.tokens_used += prompt_tokens + completion_tokens
+            self.cost_used_usd += cost
+            phase_usage = self.usage_by_phase.setdefault(
+                phase, {"calls": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0}
+            )
+            phase_usage["calls"] += 1
+            phase_usage["prompt_tokens"] += prompt_tokens
+            phase_usage["cached_prompt_tokens"] += cached_tokens
+            phase_usage["completion_tokens"] += completion_tokens
+
+    def record_expert_latency(self, expert_name, seconds):
+        with self._lock:
+            previous = self.expert_latency.get(expert_name)
+            self.expert_latency[expert_name] = seconds if previous is None else (
+                EXPERT_LATENCY_EWMA_ALPHA * seconds + (1 - EXPERT_LATENCY_EWMA_ALPHA) * previous
+            )
+
+    def start_clock(self):
+        """(Re)starts the time budget, e.g. once interactive setup is done."""
+        with self._lock:
+            self.started_at = time.monotonic()
+            self._paused_seconds = 0.0
+
+    @contextmanager
+    def paused(self):
+        """Excludes the block's wall-clock time (e.g. a cosmetic pause) from the time budget."""
+        paused_at = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._paused_seconds += time.monotonic() - paused_at
+
+    def elapsed(self):
+        return time.monotonic() - self.started_at - self._paused_seconds
+
+    def _usage(self):
+        """Returns [(name, used, limit)] for every configured budget."""
+        with self._lock:
+            usage = [
+                ("time", self.elapsed(), self.time_budget_seconds),
+                ("tokens", self.tokens_used, self.token_budget),
+                ("cost", self.cost_used_usd, self.cost_budget_usd),
+            ]
+        return [(name, used, limit) for name, used, limit in usage if limit is not None]
+
+    def remaining(self):
+        """Returns {"time"/"tokens"/"cost": amount left} for every configured budget."""
+        return {name: limit - used for name, used, limit in self._usage()}
+
+    def fraction_used(self):
+        """Fraction of the tightest configured budget consumed so far (0.0 when unbudgeted)."""
+        return max((used / limit if limit else 1.0 for _, used, limit in self._usage()), default=0.0)
+
+    def mark_turn_complete(self):
+        with self._lock:
+            self._turn_marks.append((self.elapsed(), self.tokens_used, self.cost_used_usd))
+
+    def _average_turn_usage(self):
+        with self._lock:
+            if not self._turn_marks:
+                return None
+            elapsed, tokens, cost = self._turn_marks[-1]
+            turns = len(self._turn_marks)
+        return {"time": elapsed / turns, "tokens": tokens / turns, "cost": cost / turns}
+
+    def slow_experts(self):
+        with self._lock:
+            if len(self.expert_latency) < 2:
+                return []
+            fastest = min(self.expert_latency.values())
+            return [name for name, latency in self.expert_latency.items() if latency > fastest * SLOW_EXPERT_FACTOR]
+
+    def evaluate(self, at_turn_start=False):
+        """
+        Returns the policy for the rest of the current turn:
+        {"end_session", "skip_dreaming", "skip_collaboration", "max_tokens_scale", "drop_experts", "reasons"}.
+        At the start of a turn it also ends the session if another average turn would not fit.
+        """
+        policy = {
+            "end_session": False, "skip_dreaming": False, "skip_collaboration": False,
+            "max_tokens_scale": 1.0, "drop_experts": [], "reasons": []
+        }
+        if not self.enabled:
+            return policy
+
+        fraction = self.fraction_used()
+        usage = self._usage()
+        exhausted = [name for name, used, limit in usage if used >= limit]
+        if exhausted:
+            policy["end_session"] = True
+            policy["reasons"].append(f"{'/'.join(exhausted)} budget exhausted")
+            return policy
+
+        average_turn = self._average_turn_usage() if at_turn_start else None
+        if average_turn:
+            wont_fit = [name for name, used, limit in usage if used + average_turn[name] > limit]
+            if wont_fit:
+                policy["end_session"] = True
+                policy["reasons"].append(f"another turn would exceed the {'/'.join(wont_fit)} budget")
+                return policy
+
+        if fraction >= SHED_OPTIONAL_PHASES_AT:
+            policy["skip_dreaming"] = True
+            policy["skip_collaboration"] = True
+            policy["reasons"].append(f"{fraction:.0%} of budget used: shedding dreaming/collaboration")
+        if fraction >= REDUCE_OUTPUT_AT:
+            policy["max_tokens_scale"] = REDUCED_MAX_TOKENS_SCALE
+            policy["drop_experts"] = self.slow_experts()
+            policy["reasons"].append(f"{fraction:.0%} of budget used: reducing max_tokens and dropping slow experts")
+        return policy
+
+    def snapshot(self, by_phase=True):
+        """Budget state; `by_phase` adds per-phase token usage and prompt-cache hit rates."""
+        with self._lock:
+            snapshot = {
+                "elapsed_seconds": round(self.elapsed(), 2),
+                "tokens_used": self.tokens_used,
+                "cost_used_usd": round(self.cost_used_usd, 6),
+                "time_budget_seconds": self.time_budget_seconds,
+                "token_budget": self.token_budget,
+                "cost_budget_usd": self.cost_budget_usd,
+            }
+            if by_phase:
+                snapshot["usage_by_phase"] = {
+                    phase: {**usage, "prompt_cache_hit_rate": (
+                        round(usage["cached_prompt_tokens"] / usage["prompt_tokens"], 4) if usage["prompt_tokens"] else None
+                    )}
+                    for phase, usage in self.usage_by_phase.items()
+                }
+        return snapshot
+
+# --- Hooks used by the LLM utilities (no-ops when no budget is active) ---
+
+def record_llm_usage(model, prompt_tokens, completion_tokens, cached_tokens=0, phase="other"):
+    budget = _active_budget.get()
+    if budget is not None:
+        budget.charge(model, prompt_tokens, completion_tokens, cached_tokens=cached_tokens, phase=phase)
+
+def record_expert_latency(expert_name, seconds):
+    budget = _active_budget.get()
+    if budget is not None:
+        budget.record_expert_latency(expert_name, seconds)
+
+def apply_max_tokens_budget(max_tokens):
+    """Scales a call's max_tokens down when the active budget asks for shorter outputs."""
+    budget = _active_budget.get()
+    if budget is None or budget.max_tokens_scale >= 1.0 or not max_tokens:
+        return max_tokens
+    increment("budget_reduced_max_tokens_calls_total")
+    return max(MIN_MAX_TOKENS, int(max_tokens * budget.max_tokens_scale))
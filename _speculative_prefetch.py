@@ -0,0 +1,97 @@
+# _speculative_prefetch.py
+import contextvars
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from _metrics import increment
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHED_PREFETCHES = 4 # Unclaimed speculative fan-outs kept around in case a later turn asks the same question
+
+class SpeculativePrefetcher:
+    """
+    Runs the next turn's expert fan-out in the background while the current turn is
+    still being graded/reflected on. Results are keyed by question: if the loop ends up
+    asking that question it is a hit, otherwise the speculation is cancelled (if it has
+    not started yet) or cached until evicted, and its tokens are counted as wasted.
+    """
+    def __init__(self, max_cached=MAX_CACHED_PREFETCHES, max_workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative-prefetch")
+        self._entries = OrderedDict() # question -> Future[(expert_responses, tokens_used)]
+        self._max_cached = max_cached
+        self._lock = threading.Lock()
+        self.stats = {"started": 0, "hits": 0, "misses": 0, "cancelled": 0, "wasted_tokens": 0}
+
+    def _bump(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def start(self, question, fetch_fn):
+        """Schedules `fetch_fn()` (returning (expert_responses, tokens_used)) for `question`."""
+        if question in self._entries:
+            return
+        logger.info(f"Speculatively prefetching expert responses for: '{question}'")
+        # Run in a copy of the caller's context so the active session budget is charged
+        self._entries[question] = self._executor.submit(contextvars.copy_context().run, fetch_fn)
+        self._bump("started")
+        increment("speculative_prefetch_started_total")
+        while len(self._entries) > self._max_cached:
+            _, oldest = self._entries.popitem(last=False)
+            self._discard(oldest)
+
+    def claim(self, question):
+        """
+        Returns the prefetched (expert_responses, tokens_used) for `question`, or None.
+        A claim only counts as a miss if some speculation was outstanding.
+        """
+        if not self._entries:
+            return None
+        future = self._entries.pop(question, None)
+        if future is None:
+            self._bump("misses")
+            increment("speculative_prefetch_total", outcome="miss")
+            logger.info("Speculative prefetch miss: next question was overridden.")
+            return None
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning(f"Speculative prefetch for '{question}' failed, querying experts directly: {e}")
+            self._bump("misses")
+            increment("speculative_prefetch_total", outcome="error")
+            return None
+        self._bump("hits")
+        increment("speculative_prefetch_total", outcome="hit")
+        logger.info("Speculative prefetch hit: reusing expert responses.")
+        return result
+
+    def _discard(self, future):
+        if future.cancel():
+            self._bump("cancelled")
+            increment("speculative_prefetch_cancelled_total")
+            return
+        def _count_waste(done_future):
+            if done_future.cancelled() or done_future.exception() is not None:
+                return
+            _, tokens_used = done_future.result()
+            self._bump("wasted_tokens", tokens_used)
+            increment("speculative_prefetch_wasted_tokens_total", tokens_used)
+        future.add_done_callback(_count_waste)
+
+    def discard_pending(self):
+        """Discards every unclaimed speculation, e.g. once the session is known to end."""
+        while self._entries:
+            _, future = self._entries.popitem(last=False)
+            self._discard(future)
+
+    def close(self):
+        """Discards unclaimed speculations, waits for in-flight ones and returns the final stats."""
+        self.discard_pending()
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            stats = dict(self.stats)
+        claimed = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / claimed if claimed else None
+        return stats
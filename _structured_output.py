@@ -0,0 +1,221 @@
+# _structured_output.py
+import ast
+import json
+import logging
+import re
+
+from _llm_utils import call_llm_with_retry
+from _metrics import increment
+
+logger = logging.getLogger(__name__)
+
+MAX_REASKS = 1 # Targeted re-asks after local repair fails (each costs one extra call)
+
+# Schemas for every JSON-mode phase: field -> (expected type, required, default)
+SCHEMAS = {
+    "synthesis": {
+        "synthesis": (str, True, "No synthesis provided."),
+        "new_questions": (list, True, []),
+    },
+    "grade": {
+        "relevance_score": (float, True, 0.0),
+        "coherence_score": (float, True, 0.0),
+        "completeness_score": (float, True, 0.0),
+        "depth_score": (float, True, 0.0),
+        "novelty_questions_score": (float, True, 0.0),
+        "overall_grade": (float, True, 0.0),
+        "grade_reasoning": (str, False, ""),
+    },
+    "reflection": {
+        "reflection_summary": (str, True, ""),
+        "areas_for_improvement": (list, False, []),
+        "suggested_strategy_adjustments": (dict, False, {}),
+    },
+    "dream": {
+        "dream_ideas": (list, True, []),
+        "dream_summary": (str, False, ""),
+    },
+    "collaboration": {
+        "refined_idea": (str, True, ""),
+        "summary": (str, True, ""),
+        "new_questions": (list, False, []),
+    },
+}
+
+class StructuredOutputError(ValueError):
+    """Raised when an LLM reply cannot be turned into a payload matching its schema."""
+    def __init__(self, message, raw_content=None, errors=None):
+        super().__init__(message)
+        self.raw_content = raw_content
+        self.errors = errors or []
+
+_CODE_FENCE_RE = re.compile(r"^\s*```(?:json|JSON)?\s*(.*?)\s*```\s*$", re.DOTALL)
+
+def _repair_json_text(text):
+    """Strips the most common wrappers around a JSON reply: code fences and surrounding prose."""
+    repaired = text.strip()
+    fenced = _CODE_FENCE_RE.match(repaired)
+    if fenced:
+        repaired = fenced.group(1)
+    # Drop any prose before/after the outermost object
+    start, end = repaired.find("{"), repaired.rfind("}")
+    if start != -1 and end > start:
+        repaired = repaired[start:end + 1]
+    return repaired
+
+def _strip_trailing_commas(text):
+    """Removes commas directly before a closing '}' or ']', leaving JSON string contents untouched."""
+    out = []
+    in_string = escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            rest = text[index + 1:].lstrip()
+            if rest[:1] in ("}", "]"):
+                continue
+        out.append(char)
+    return "".join(out)
+
+def _loads_repaired(text):
+    """
+    Parses repaired text as JSON, then with trailing commas removed, and finally as a
+    Python literal (True/False/None, single quotes) so such tokens are only converted
+    outside of strings.
+    """
+    try:
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError as e:
+        try:
+            return json.loads(_strip_trailing_commas(text), strict=False)
+        except json.JSONDecodeError:
+            pass
+        try:
+            return ast.literal_eval(text)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            raise e
+
+def _coerce_value(value, expected_type):
+    """Coerces `value` to `expected_type` where the intent is unambiguous; returns (value, ok)."""
+    if isinstance(value, expected_type) and not (expected_type is float and isinstance(value, bool)):
+        return value, True
+    if expected_type is float:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return float(value), True
+        if isinstance(value, str):
+            text = value.strip()
+            try:
+                if text.endswith("%"):
+                    return float(text[:-1]) / 100.0, True
+                return float(text), True
+            except ValueError:
+                return value, False
+    if expected_type is list:
+        if isinstance(value, str):
+            return [value], True
+        if isinstance(value, tuple):
+            return list(value), True
+    if expected_type is str:
+        if isinstance(value, (int, float)):
+            return str(value), True
+        if isinstance(value, list) and all(isinstance(v, str) for v in value):
+            return "\n".join(value), True
+    return value, False
+
+def validate_payload(payload, schema_name):
+    """
+    Coerces `payload` in place against the named schema and fills optional defaults.
+    Returns (payload, errors, coerced) where `errors` lists unrecoverable problems.
+    """
+    schema = SCHEMAS[schema_name]
+    errors = []
+    coerced = False
+    if not isinstance(payload, dict):
+        return payload, [f"expected a JSON object, got {type(payload).__name__}"], False
+    for field, (expected_type, required, default) in schema.items():
+        if field not in payload or payload[field] is None:
+            if required:
+                errors.append(f"missing required field '{field}'")
+            else:
+                payload[field] = default.copy() if isinstance(default, (list, dict)) else default
+            continue
+        value, ok = _coerce_value(payload[field], expected_type)
+        if not ok:
+            errors.append(f"field '{field}' should be {expected_type.__name__}, got {type(payload[field]).__name__}")
+            continue
+        if value is not payload[field]:
+            coerced = True
+        payload[field] = value
+    return payload, errors, coerced
+
+def parse_structured_output(content, schema_name):
+    """
+    Parses an LLM reply into a schema-conforming dict, repairing it locally if needed.
+    Returns (payload, repaired) or raises StructuredOutputError.
+    """
+    content = content or ""
+    repaired = False
+    try:
+        payload = json.loads(content, strict=False) # Tolerates literal newlines inside strings
+    except json.JSONDecodeError:
+        try:
+            payload = _loads_repaired(_repair_json_text(content))
+            repaired = True
+        except json.JSONDecodeError as e:
+            raise StructuredOutputError(f"Invalid JSON for '{schema_name}': {e}", content, [str(e)]) from e
+
+    payload, errors, coerced = validate_payload(payload, schema_name)
+    if errors:
+        raise StructuredOutputError(f"'{schema_name}' payload failed validation: {errors}", content, errors)
+    return payload, repaired or coerced
+
+def _schema_hint(schema_name):
+    return ", ".join(
+        f'"{field}": {expected_type.__name__}{"" if required else " (optional)"}'
+        for field, (expected_type, required, _) in SCHEMAS[schema_name].items()
+    )
+
+def call_llm_structured(llm_client_instance, model, messages, schema_name, temperature, max_tokens, **kwargs):
+    """
+    Calls the LLM in JSON mode and returns a payload matching `schema_name`.
+    Malformed replies are first repaired locally; only if that fails is the model
+    re-asked (with the validation errors) up to MAX_REASKS times.
+    Returns (payload, response) where `response` is the last raw LLM response.
+    """
+    response = call_llm_with_retry(
+        llm_client_instance, model, messages=messages, temperature=temperature,
+        max_tokens=max_tokens, response_format={"type": "json_object"}, **kwargs
+    )
+    for attempt in range(MAX_REASKS + 1):
+        content = response.choices[0].message.content
+        try:
+            payload, repaired = parse_structured_output(content, schema_name)
+            outcome = "reasked" if attempt else ("repaired" if repaired else "ok")
+            increment("structured_output_total", schema=schema_name, outcome=outcome)
+            if outcome != "ok":
+                logger.debug(f"Structured output for '{schema_name}' recovered ({outcome}).")
+            return payload, response
+        except StructuredOutputError as e:
+            if attempt == MAX_REASKS:
+                increment("structured_output_total", schema=schema_name, outcome="failed")
+                raise
+            logger.warning(f"{e}. Re-asking {model} for a corrected JSON object.")
+            increment("structured_output_reasks_total", schema=schema_name)
+            reask_messages = messages + [
+                {"role": "assistant", "content": content or ""},
+                {"role": "user", "content": (
+                    f"Your previous reply was not valid for the required schema ({'; '.join(e.errors)}). "
+                    f"Return ONLY a corrected JSON object with these fields: {{{_schema_hint(schema_name)}}}."
+                )}
+            ]
+            response = call_llm_with_retry(
+                llm_client_instance, model, messages=reask_messages, temperature=0.0,
+                max_tokens=max_tokens, response_format={"type": "json_object"}, **kwargs
+            )
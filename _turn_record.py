@@ -0,0 +1,83 @@
+# _turn_record.py
+import json
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+INTERN_MAX_LENGTH = 200 # Only short, frequently repeated strings (ids, topic, names, profile values) are interned
+
+def intern_strings(value):
+    """Recursively interns dict keys and short string values so repeats share one object."""
+    if isinstance(value, str):
+        return sys.intern(value) if len(value) <= INTERN_MAX_LENGTH else value
+    if isinstance(value, dict):
+        return {sys.intern(k) if isinstance(k, str) else k: intern_strings(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [intern_strings(v) for v in value]
+    return value
+
+def profile_delta(previous_profile, current_profile):
+    """Returns only the profile fields that changed since `previous_profile` (removed keys map to None)."""
+    delta = {key: value for key, value in current_profile.items() if previous_profile.get(key) != value}
+    for key in previous_profile:
+        if key not in current_profile:
+            delta[key] = None
+    return delta
+
+def _dedupe_collaboration_log(collaboration_data):
+    """Expert messages already stored in expert_feedback are referenced instead of copied."""
+    if not collaboration_data or not collaboration_data.get("collaboration_log"):
+        return collaboration_data
+    expert_feedback = collaboration_data.get("expert_feedback") or {}
+    compact_log = []
+    for entry in collaboration_data["collaboration_log"]:
+        speaker = entry.get("speaker")
+        if speaker in expert_feedback and entry.get("message") == expert_feedback[speaker]:
+            reference = {key: value for key, value in entry.items() if key != "message"} # Keeps speaker/round
+            compact_log.append({**reference, "message_ref": "expert_feedback"})
+        else:
+            compact_log.append(entry)
+    return {**collaboration_data, "collaboration_log": compact_log}
+
+def compact_turn(turn_data):
+    """Builds the compact turn record that is journaled and written to the session log."""
+    record = dict(turn_data)
+    if record.get("collaboration_data"):
+        record["collaboration_data"] = _dedupe_collaboration_log(record["collaboration_data"])
+    return record
+
+class TurnJournal:
+    """
+    Append-only JSONL file holding a session's full turn records.
+    Once a turn is journaled the session keeps only a small stub in memory, so the
+    per-session footprint stays flat as turns accumulate.
+    """
+    def __init__(self, directory, session_id):
+        self.path = os.path.join(directory, f"{session_id}.turns.jsonl")
+
+    def append(self, turn_record):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(turn_record) + "\n")
+
+    def iter_turns(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+def turn_stub(turn_record):
+    """The in-memory placeholder kept in session_log["turns"] for a journaled turn."""
+    return {
+        "turn_number": turn_record["turn_number"],
+        "overall_grade": (turn_record.get("grade_data") or {}).get("overall_grade")
+    }
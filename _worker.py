@@ -0,0 +1,105 @@
+# _worker.py
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+from _job_queue import get_job_queue
+from _metrics import increment, maybe_start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 300        # A job is re-queued if its worker misses heartbeats for this long
+HEARTBEAT_INTERVAL = 60    # How often a busy worker renews its lease
+POLL_INTERVAL = 5          # Idle wait between claim attempts when the queue is empty
+# Sessions that end for these reasons return normally but count as failed attempts, so the job is retried
+FAILED_TERMINATION_REASONS = ("api_error", "error")
+
+class _LeaseHeartbeat(threading.Thread):
+    """Renews a job's lease in the background while the learning session runs."""
+    def __init__(self, queue, job_id, worker_id, lease_seconds=LEASE_SECONDS, interval=HEARTBEAT_INTERVAL):
+        super().__init__(name=f"heartbeat-job-{job_id}", daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.worker_id, self.lease_seconds):
+                    logger.warning(f"Worker {self.worker_id} lost the lease on job {self.job_id}.")
+                    return
+            except Exception as e:
+                logger.warning(f"Heartbeat for job {self.job_id} failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def run_worker(queue_url, worker_id=None, exit_when_empty=False, metrics_port_offset=0):
+    """
+    Claims topic jobs from the queue and runs a learning session for each until
+    stopped (SIGINT/SIGTERM finish the current job first) or, with
+    `exit_when_empty`, until the queue has no queued jobs left.
+    Returns the number of jobs this worker completed.
+    """
+    maybe_start_metrics_server(metrics_port_offset) # One endpoint per worker process
+    # Imported here so the heavy client setup only happens in processes that run sessions
+    from main_learning_loop import run_learning_session
+
+    queue = get_job_queue(queue_url)
+    worker_id = worker_id or default_worker_id()
+    stop_requested = threading.Event()
+
+    def _request_stop(signum, frame):
+        logger.info(f"Worker {worker_id} received signal {signum}; stopping after the current job.")
+        stop_requested.set()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, _request_stop)
+        signal.signal(signal.SIGTERM, _request_stop)
+
+    logger.info(f"Worker {worker_id} started on queue {queue_url}")
+    completed = 0
+    while not stop_requested.is_set():
+        job = queue.claim(worker_id, LEASE_SECONDS)
+        if job is None:
+            if exit_when_empty:
+                break
+            stop_requested.wait(POLL_INTERVAL)
+            continue
+
+        logger.info(f"Worker {worker_id} claimed job {job['id']} (attempt {job['attempts']}): '{job['topic']}'")
+        heartbeat = _LeaseHeartbeat(queue, job["id"], worker_id)
+        heartbeat.start()
+        try:
+            result = run_learning_session(
+                initial_topic=job["topic"],
+                super_agent_profile_key=job["super_agent_profile_key"],
+                session_id=f"super_agent_learning_{int(time.time() * 1000)}_job{job['id']}_attempt{job['attempts']}"
+            )
+            if result["termination_reason"].split(":")[0] in FAILED_TERMINATION_REASONS:
+                logger.warning(f"Worker {worker_id} failed job {job['id']}: {result['termination_reason']}")
+                queue.fail(job["id"], worker_id, result["termination_reason"])
+                increment("worker_jobs_total", outcome="failed")
+            else:
+                queue.complete(job["id"], worker_id, result)
+                completed += 1
+                increment("worker_jobs_total", outcome="completed")
+                logger.info(f"Worker {worker_id} completed job {job['id']}: {result['termination_reason']}")
+        except Exception as e:
+            logger.error(f"Worker {worker_id} failed job {job['id']}: {e}", exc_info=True)
+            queue.fail(job["id"], worker_id, repr(e))
+            increment("worker_jobs_total", outcome="failed")
+        finally:
+            heartbeat.stop()
+
+    logger.info(f"Worker {worker_id} stopping after {completed} job(s).")
+    return completed
@@ -0,0 +1,87 @@
+"""
+Memory benchmark for per-session turn bookkeeping.
+
+Drives synthetic turns (with realistically sized expert responses, syntheses and
+collaboration logs) through the same session-log and training-data functions the
+learning loop uses, and reports retained Python heap per session and process RSS
+as turns and concurrent sessions grow. No LLM calls are made; all output goes to a
+temporary directory.
+
+    python bench_session_memory.py
+"""
+import os
+import sys
+import tempfile
+import tracemalloc
+
+TURN_COUNTS = [10, 50, 200]
+SESSION_COUNTS = [1, 4, 16]
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # Peak, not current, off Linux
+
+def _synthetic_turn(session_id, turn_number, profile):
+    expert_text = lambda name: f"{name} perspective on turn {turn_number}. " + ("Detailed explanation. " * 100)
+    expert_responses = {name: expert_text(name) for name in ("openai_gpt", "google_gemini", "grok_expert")}
+    return {
+        "session_id": session_id,
+        "turn_number": turn_number,
+        "timestamp_turn_start": "2024-01-01T00:00:00",
+        "initial_topic": "benchmark topic",
+        "super_agent_knowledge_state": profile["current_knowledge_state"],
+        "super_agent_profile_delta": {},
+        "question_asked": f"Question {turn_number} about the benchmark topic?",
+        "expert_responses": expert_responses,
+        "super_agent_synthesis": f"Synthesis {turn_number}. " + ("Combined insight. " * 150),
+        "next_questions": [f"Follow-up {turn_number}a?", f"Follow-up {turn_number}b?"],
+        "grade_data": {"overall_grade": 0.7, "completeness_score": 0.7, "grade_reasoning": "ok"},
+        "reflection_data": {"reflection_summary": "Reflection. " * 20, "suggested_strategy_adjustments": {}},
+        "dream_data": {},
+        "collaboration_data": {
+            "initial_idea": "idea",
+            "expert_feedback": dict(expert_responses),
+            "collaboration_log": [{"speaker": name, "message": text} for name, text in expert_responses.items()],
+            "refined_idea": "refined", "summary": "summary", "new_questions": []
+        },
+        "timestamp_turn_end": "2024-01-01T00:00:01"
+    }
+
+def run_benchmark():
+    from _agent_profiles import SUPER_AGENT_PROFILES
+    from _data_formatter import (
+        initialize_session_log, add_turn_to_session_log,
+        append_training_data_from_turn, finalize_session_log
+    )
+
+    print(f"{'turns':>6} {'sessions':>9} {'retained KiB/session':>21} {'RSS MiB':>9}")
+    for turns in TURN_COUNTS:
+        for sessions in SESSION_COUNTS:
+            tracemalloc.start()
+            baseline, _ = tracemalloc.get_traced_memory()
+            profile = dict(SUPER_AGENT_PROFILES["technical_master"])
+            session_logs = [
+                initialize_session_log(f"bench_{turns}_{sessions}_{i}", "benchmark topic", dict(profile))
+                for i in range(sessions)
+            ]
+            # Interleave sessions turn by turn, as concurrent workers would
+            for turn_number in range(1, turns + 1):
+                for session_log in session_logs:
+                    turn_data = _synthetic_turn(session_log["session_id"], turn_number, profile)
+                    append_training_data_from_turn(turn_data)
+                    add_turn_to_session_log(session_log, turn_data)
+            retained, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{turns:>6} {sessions:>9} {(retained - baseline) / sessions / 1024:>21.1f} {_rss_mb():>9.1f}")
+            for session_log in session_logs:
+                os.remove(finalize_session_log(session_log, profile))
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir) # _data_formatter creates its output directories relative to the cwd
+        run_benchmark()
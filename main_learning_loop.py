@@ -1,37 +1,55 @@
 # main_learning_loop.py
 
 import os
+import copy
 import json
 import time
 import logging
 from datetime import datetime
+from functools import partial
 from openai import OpenAI
 import google.generativeai as genai
 # import anthropic # Uncomment if you use Anthropic Claude
 # from groq import Groq # Uncomment if you use Groq for Llama/Mixtral
 from dotenv import load_dotenv
 
+# Load .env before importing our modules: several read their settings (HTTP_*, METRICS_*, ...) at import time
+load_dotenv()
+
 # Import our modularized components
 from _llm_utils import call_llm_with_retry
+from _http_transport import get_shared_http_client, build_timeout
+from _metrics import snapshot as metrics_snapshot, increment, add_to_gauge, maybe_start_metrics_server
 from _agent_profiles import SUPER_AGENT_PROFILES, EXPERT_AGENT_PROFILES
 from _learning_modules import (
-    simulate_learning_turn, grade_learning_turn, reflect_on_learning_turn,
+    query_experts, simulate_learning_turn, grade_learning_turn, reflect_on_learning_turn,
     dream_about_topic, collaborate_on_ideas
 )
 from _learning_history import LearningHistory
+from _expert_selection import ExpertSelector
+from _speculative_prefetch import SpeculativePrefetcher
+from _convergence import ConvergenceMonitor
+from _session_budget import SessionBudget
+from _beam_exploration import BeamExplorer
+from _turn_record import profile_delta
 from _data_formatter import (
-    initialize_session_log, finalize_session_log,
+    SESSION_LOG_DIR, initialize_session_log, finalize_session_log,
     add_turn_to_session_log, append_training_data_from_turn
 )
 
 # --- Setup ---
-load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # --- Initialize LLM Clients ---
-# Initialize OpenAI client for Super Agent (or specific expert roles)
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Initialize OpenAI client for Super Agent (or specific expert roles).
+# All sessions share one pooled keep-alive HTTP client (see _http_transport.py),
+# so concurrent sessions reuse connections instead of paying TLS handshakes.
+openai_client = OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_client=get_shared_http_client(),
+    timeout=build_timeout()
+)
 
 # Initialize Google Gemini client for expert role
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
@@ -41,13 +59,13 @@ gemini_generative_model = genai.GenerativeModel('gemini-1.5-flash') # Use the cl
 # anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 # groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
-# Map client instances to expert profiles
+# Map client instances to expert profiles (profile_name/role are used in the expert prompts)
 EXPERT_LLM_INSTANCES = {
-    "openai_gpt": {"client": openai_client, "model": EXPERT_AGENT_PROFILES["openai_gpt"]["model"]},
-    "google_gemini": {"client": gemini_generative_model, "model": EXPERT_AGENT_PROFILES["google_gemini"]["model"]},
-    # "grok_expert": {"client": groq_client, "model": EXPERT_AGENT_PROFILES["grok_expert"]["model"]},
-    # "claude_expert": {"client": anthropic_client, "model": EXPERT_AGENT_PROFILES["claude_expert"]["model"]},
-    # "mistral_expert": {"client": mistral_client_instance, "model": EXPERT_AGENT_PROFILES["mistral_expert"]["model"]},
+    "openai_gpt": {"client": openai_client, **EXPERT_AGENT_PROFILES["openai_gpt"]},
+    "google_gemini": {"client": gemini_generative_model, **EXPERT_AGENT_PROFILES["google_gemini"]},
+    # "grok_expert": {"client": groq_client, **EXPERT_AGENT_PROFILES["grok_expert"]},
+    # "claude_expert": {"client": anthropic_client, **EXPERT_AGENT_PROFILES["claude_expert"]},
+    # "mistral_expert": {"client": mistral_client_instance, **EXPERT_AGENT_PROFILES["mistral_expert"]},
 }
 
 # --- Configuration for the Learning Loop ---
@@ -59,7 +77,8 @@ if not selected_super_agent_profile:
     exit()
 
 # Assign a model to the selected super agent profile (e.g., GPT-4o for a powerful SA)
-selected_super_agent_profile["model"] = "gpt-4o" # Or "gpt-3.5-turbo-0125" if you prefer
+SUPER_AGENT_MODEL = "gpt-4o" # Or "gpt-3.5-turbo-0125" if you prefer
+selected_super_agent_profile["model"] = SUPER_AGENT_MODEL
 # You would also need to assign the appropriate client instance. For simplicity,
 # we'll use openai_client as the "super_agent_client" below. If your SA uses a
 # different API (e.g., Gemini-Pro), you'd assign that client here.
@@ -69,14 +88,100 @@ MAX_LEARNING_TURNS = 10 # Limit the number of iterations for a single session
 DREAM_INTERVAL = 3    # Super Agent will 'dream' every N turns
 COLLAB_INTERVAL = 5   # Super Agent will 'collaborate' every N turns
 
+# Adaptive expert selection: query only the top-k experts per turn, learned per topic/profile.
+# By default one expert fewer than configured is queried on pruned turns; every expert is still
+# queried on the first turns and then on a EXPERT_EXPLORATION_RATE share of turns, which is
+# where the experts are compared and credited. Set EXPERT_TOP_K = None to always query every expert.
+EXPERT_TOP_K = max(1, len(EXPERT_LLM_INSTANCES) - 1)
+EXPERT_EXPLORATION_RATE = 0.2
+expert_selector = ExpertSelector(
+    top_k=EXPERT_TOP_K,
+    exploration_rate=EXPERT_EXPLORATION_RATE,
+    state_path=os.path.join(SESSION_LOG_DIR, "expert_selection_state.json")
+)
+
+# Start the next turn's expert queries for next_questions[0] while grading/reflection run
+SPECULATIVE_PREFETCH = True
+
+# What to do once the grade plateaus and the synthesis stops changing:
+# "stop" ends the session; "cheap_then_stop" first drops to a cheaper mode
+# (fewer experts, no dreaming/collaboration) and ends the session if it converges again.
+CONVERGENCE_ACTION = "cheap_then_stop"
+CHEAP_MODE_EXPERT_TOP_K = 1
+
+def _env_number(name, cast=float):
+    value = os.getenv(name)
+    return cast(value) if value else None
+
+# Per-session budgets (unset = unlimited). As a session nears its tightest budget it sheds
+# dreaming/collaboration, then lowers max_tokens and drops slow experts, and finally ends
+# before starting a turn that would not fit. See _session_budget.py for the thresholds.
+SESSION_TIME_BUDGET_SECONDS = _env_number("SESSION_TIME_BUDGET_SECONDS")
+SESSION_TOKEN_BUDGET = _env_number("SESSION_TOKEN_BUDGET", int)
+SESSION_COST_BUDGET_USD = _env_number("SESSION_COST_BUDGET_USD")
+
+# "chain" follows next_questions[0] one turn at a time (with reflection, dreaming and collaboration);
+# "beam" expands several next_questions concurrently and keeps the best-graded branches
+# (expert fan-out, synthesis and grading only). See _beam_exploration.py.
+EXPLORATION_MODE = "chain"
+BEAM_WIDTH = 2
+BEAM_BRANCHING_FACTOR = 2
+BEAM_MAX_DEPTH = 4
+BEAM_MAX_PARALLEL_BRANCHES = 4
+BEAM_TOKEN_BUDGET = _env_number("BEAM_TOKEN_BUDGET", int) # Unset = limited only by the session budget
+
+def _history_entry(turn_data):
+    """
+    Builds the compact record of a turn kept in LearningHistory for later prompts.
+    Text is cut to the lengths get_concise_history_for_prompt uses, so nothing more is retained.
+    """
+    return {
+        "turn_number": turn_data["turn_number"],
+        "question_asked": turn_data["question_asked"][:150],
+        "super_agent_synthesis": turn_data["super_agent_synthesis"][:250],
+        "grade_data": {"overall_grade": turn_data["grade_data"].get("overall_grade", "N/A")},
+        "reflection_data": {"reflection_summary": turn_data["reflection_data"].get("reflection_summary", "")[:100]}
+    }
+
+def _shed_phase(session_log, turn_num, phase, reasons):
+    """Records an optional phase skipped to stay within the session budget."""
+    reason = "; ".join(reasons)
+    session_log.setdefault("shed_phases", []).append({"turn_number": turn_num, "phase": phase, "reason": reason})
+    increment("budget_phases_shed_total", phase=phase)
+    logger.info(f"Budget: skipping {phase} this turn ({reason}).")
+
 # --- Main Learning Loop ---
-def run_learning_session():
-    session_id = f"super_agent_learning_{int(time.time() * 1000)}_{selected_super_agent_profile['profile_name'].replace(' ', '_')}"
+def run_learning_session(initial_topic=None, super_agent_profile_key=None, session_id=None):
+    """
+    Runs one learning session and returns a summary of it.
+    Prompts for the topic interactively unless `initial_topic` is given (e.g. by a worker).
+    """
+    budget = SessionBudget(SESSION_TIME_BUDGET_SECONDS, SESSION_TOKEN_BUDGET, SESSION_COST_BUDGET_USD)
+    add_to_gauge("learning_sessions_in_flight", 1)
+    try:
+        with budget.activate(): # Every LLM call in this session (and its prefetches) is charged to it
+            summary = _run_learning_session(initial_topic, super_agent_profile_key, session_id, budget)
+    finally:
+        add_to_gauge("learning_sessions_in_flight", -1)
+    increment("learning_sessions_completed_total", reason=summary["termination_reason"].split(":")[0])
+    return summary
+
+def _run_learning_session(initial_topic, super_agent_profile_key, session_id, budget):
+    # Each session adjusts its own copy of the profile, so sessions never leak adjustments into each other
+    profile_key = super_agent_profile_key or SELECTED_SUPER_AGENT_PROFILE_KEY
+    if profile_key not in SUPER_AGENT_PROFILES:
+        raise ValueError(f"Super Agent profile '{profile_key}' not found.")
+    selected_super_agent_profile = copy.deepcopy(SUPER_AGENT_PROFILES[profile_key])
+    selected_super_agent_profile["model"] = SUPER_AGENT_MODEL
+
+    session_id = session_id or f"super_agent_learning_{int(time.time() * 1000)}_{selected_super_agent_profile['profile_name'].replace(' ', '_')}"
     logger.info(f"--- Starting New Super Agent Learning Session: {session_id} ---")
     logger.info(f"Selected Super Agent Profile: {selected_super_agent_profile['profile_name']}")
 
-    initial_topic = input("Enter the topic the Super Agent should learn about and master: ")
+    if initial_topic is None:
+        initial_topic = input("Enter the topic the Super Agent should learn about and master: ")
     logger.info(f"Super Agent will learn about: '{initial_topic}'")
+    budget.start_clock() # Time spent typing the topic doesn't count against the session's time budget
 
     # This is where your "prep-rompt" logic would come in for a UI
     # For now, let's use a generic initial question
@@ -87,8 +192,31 @@ def run_learning_session():
 
     # Initialize the comprehensive session log
     session_log = initialize_session_log(session_id, initial_topic, selected_super_agent_profile.copy())
+    last_profile_snapshot = selected_super_agent_profile.copy() # Turns store deltas against this
+    prefetcher = SpeculativePrefetcher() if SPECULATIVE_PREFETCH and EXPLORATION_MODE == "chain" else None
+    convergence_monitor = ConvergenceMonitor()
+    cheap_mode = False
+    expert_top_k = None # None -> the selector's default
+    session_log["termination_reason"] = "max_turns_reached"
+
+    if EXPLORATION_MODE == "beam":
+        _explore_beam(session_id, initial_topic, current_question_for_experts, selected_super_agent_profile, session_log, budget)
+        return _finish_session(session_id, initial_topic, session_log, selected_super_agent_profile, budget, prefetcher)
 
     for turn_num in range(1, MAX_LEARNING_TURNS + 1):
+        # Decide up front whether another turn fits the budget, and how lean it must be
+        budget_policy = budget.evaluate(at_turn_start=True)
+        if budget_policy["end_session"]:
+            session_log["termination_reason"] = f"budget: {'; '.join(budget_policy['reasons'])}"
+            logger.info(f"Session budget reached ({'; '.join(budget_policy['reasons'])}). Ending session.")
+            break
+        budget.max_tokens_scale = budget_policy["max_tokens_scale"]
+        available_experts = {
+            name: config for name, config in EXPERT_LLM_INSTANCES.items() if name not in budget_policy["drop_experts"]
+        } or EXPERT_LLM_INSTANCES # Never drop every expert
+        if budget_policy["drop_experts"]:
+            _shed_phase(session_log, turn_num, f"experts:{','.join(budget_policy['drop_experts'])}", budget_policy["reasons"])
+
         logger.info(f"\n--- Learning Turn {turn_num} ---")
         current_knowledge_state = selected_super_agent_profile.get("current_knowledge_state", "novice")
         logger.info(f"Super Agent ({current_knowledge_state}) asks Expert LLMs: '{current_question_for_experts}'")
@@ -99,7 +227,8 @@ def run_learning_session():
             "turn_number": turn_num,
             "timestamp_turn_start": datetime.now().isoformat(),
             "initial_topic": initial_topic,
-            "super_agent_profile_at_turn": selected_super_agent_profile.copy(), # Snapshot of profile state
+            "super_agent_knowledge_state": current_knowledge_state,
+            "super_agent_profile_delta": profile_delta(last_profile_snapshot, selected_super_agent_profile), # Changes since the previous turn
             "question_asked": current_question_for_experts,
             "expert_responses": {},
             "super_agent_synthesis": "",
@@ -110,15 +239,27 @@ def run_learning_session():
             "collaboration_data": {}
         }
 
+        last_profile_snapshot = selected_super_agent_profile.copy()
+
         try:
-            # 1. Simulate Learning Turn (Query Experts & Initial Synthesis)
+            # 1. Simulate Learning Turn (Query selected Experts & Initial Synthesis)
+            prefetched = prefetcher.claim(current_question_for_experts) if prefetcher else None
+            if prefetched:
+                prefetched_responses, _ = prefetched
+                selected_experts = {name: EXPERT_LLM_INSTANCES[name] for name in prefetched_responses}
+            else:
+                prefetched_responses = None
+                selected_experts = expert_selector.select(
+                    available_experts, initial_topic, selected_super_agent_profile["profile_name"], top_k=expert_top_k
+                )
             turn_results = simulate_learning_turn(
                 super_agent_api_client, # Use the actual client for the SA
-                EXPERT_LLM_INSTANCES, # Dictionary of expert clients
+                selected_experts, # Dictionary of expert clients chosen for this turn
                 initial_topic,
                 current_question_for_experts,
                 learning_history.get_concise_history_for_prompt(), # Pass concise history for prompt
-                selected_super_agent_profile
+                selected_super_agent_profile,
+                expert_responses=prefetched_responses
             )
             current_turn_data.update({
                 "expert_responses": turn_results["expert_responses"],
@@ -129,6 +270,21 @@ def run_learning_session():
             logger.info("\n--- Super Agent Synthesis ---")
             logger.info(current_turn_data["super_agent_synthesis"])
 
+            # Speculatively start the likely next turn's expert fan-out while this turn is evaluated.
+            # Its prompts see this turn in the history, just without grade/reflection yet.
+            if prefetcher and current_turn_data["next_questions"] and turn_num < MAX_LEARNING_TURNS:
+                speculative_question = current_turn_data["next_questions"][0]
+                speculative_experts = expert_selector.select(
+                    available_experts, initial_topic, selected_super_agent_profile["profile_name"], top_k=expert_top_k
+                )
+                prefetcher.start(speculative_question, partial(
+                    query_experts,
+                    speculative_experts,
+                    initial_topic,
+                    speculative_question,
+                    learning_history.get_concise_history_for_prompt(pending_turn=_history_entry(current_turn_data))
+                ))
+
             # 2. Grade the Turn
             grade_data = grade_learning_turn(
                 super_agent_api_client, # Grading is done by the Super Agent's main LLM
@@ -142,34 +298,67 @@ def run_learning_session():
             current_turn_data["grade_data"] = grade_data
             logger.info(f"--- Grade: {grade_data.get('overall_grade', 'N/A'):.2f} (Reason: {grade_data.get('grade_reasoning', 'No reason.')}) ---")
 
-            # 3. Reflect on the Turn
-            reflection_data = reflect_on_learning_turn(
-                super_agent_api_client, # Reflection by Super Agent's main LLM
+            # Credit the queried experts with their contribution to this turn's synthesis
+            expert_selector.update(
                 initial_topic,
-                current_turn_data,
+                selected_super_agent_profile["profile_name"],
+                current_turn_data["expert_responses"],
+                current_turn_data["super_agent_synthesis"],
                 grade_data,
-                learning_history.get_concise_history_for_prompt()
+                total_experts=len(EXPERT_LLM_INSTANCES)
+            )
+
+            # Check whether this turn still added anything over the previous ones
+            # (a failed grading call is not a real grade, so it does not count towards the slope)
+            convergence = convergence_monitor.observe(
+                None if grade_data.get("grading_failed") else grade_data.get("overall_grade"),
+                current_turn_data["super_agent_synthesis"]
             )
-            current_turn_data["reflection_data"] = reflection_data
-            logger.info(f"--- Reflection: {reflection_data.get('reflection_summary', 'No summary.')} ---")
-
-            # Update super agent profile based on reflection
-            if "suggested_strategy_adjustments" in reflection_data:
-                for key, value in reflection_data["suggested_strategy_adjustments"].items():
-                    if key in selected_super_agent_profile:
-                        # Handle specific adjustments, e.g., for dreaming_tendency
-                        if key == "dreaming_tendency_adjustment":
-                            if value == "increase" and selected_super_agent_profile["dreaming_tendency"] == "medium":
-                                selected_super_agent_profile["dreaming_tendency"] = "high"
-                            elif value == "decrease" and selected_super_agent_profile["dreaming_tendency"] == "medium":
-                                selected_super_agent_profile["dreaming_tendency"] = "low"
-                            # Add more complex logic if needed
-                        else:
-                            selected_super_agent_profile[key] = value
-                logger.info(f"Super Agent Profile Adjusted: {selected_super_agent_profile}")
-
-            # 4. Dreaming Phase (Conditional)
-            if turn_num % DREAM_INTERVAL == 0 and selected_super_agent_profile["dreaming_tendency"] != "low":
+            current_turn_data["convergence"] = convergence
+            # Converging ends the session unless it first drops to cheap mode; if it ends,
+            # nothing would use this turn's reflection, dream or collaboration, or the prefetch
+            session_ending = convergence["converged"] and not (CONVERGENCE_ACTION == "cheap_then_stop" and not cheap_mode)
+            if session_ending and prefetcher:
+                prefetcher.discard_pending()
+
+            # 3. Reflect on the Turn
+            if session_ending:
+                logger.info("Learning has converged; skipping reflection, dreaming and collaboration on the final turn.")
+            else:
+                reflection_data = reflect_on_learning_turn(
+                    super_agent_api_client, # Reflection by Super Agent's main LLM
+                    initial_topic,
+                    current_turn_data,
+                    grade_data,
+                    learning_history.get_concise_history_for_prompt()
+                )
+                current_turn_data["reflection_data"] = reflection_data
+                logger.info(f"--- Reflection: {reflection_data.get('reflection_summary', 'No summary.')} ---")
+
+                # Update super agent profile based on reflection
+                if "suggested_strategy_adjustments" in reflection_data:
+                    for key, value in reflection_data["suggested_strategy_adjustments"].items():
+                        if key in selected_super_agent_profile:
+                            # Handle specific adjustments, e.g., for dreaming_tendency
+                            if key == "dreaming_tendency_adjustment":
+                                if value == "increase" and selected_super_agent_profile["dreaming_tendency"] == "medium":
+                                    selected_super_agent_profile["dreaming_tendency"] = "high"
+                                elif value == "decrease" and selected_super_agent_profile["dreaming_tendency"] == "medium":
+                                    selected_super_agent_profile["dreaming_tendency"] = "low"
+                                # Add more complex logic if needed
+                            else:
+                                selected_super_agent_profile[key] = value
+                    logger.info(f"Super Agent Profile Adjusted: {selected_super_agent_profile}")
+
+            # Optional phases are the first to go when the budget runs low
+            budget_policy = budget.evaluate()
+            budget.max_tokens_scale = min(budget.max_tokens_scale, budget_policy["max_tokens_scale"])
+
+            # 4. Dreaming Phase (Conditional, skipped in cheap mode or to save budget)
+            wants_dream = not cheap_mode and not session_ending and turn_num % DREAM_INTERVAL == 0 and selected_super_agent_profile["dreaming_tendency"] != "low"
+            if wants_dream and (budget_policy["skip_dreaming"] or budget_policy["end_session"]):
+                _shed_phase(session_log, turn_num, "dreaming", budget_policy["reasons"])
+            elif wants_dream:
                 logger.info(f"\n--- Dreaming about '{initial_topic}' ---")
                 dream_data = dream_about_topic(
                     super_agent_api_client,
@@ -187,8 +376,11 @@ def run_learning_session():
                     current_question_for_experts = f"Considering the dream idea: '{dream_data['dream_ideas'][0]}', how do the foundational concepts of {initial_topic} apply to this, or what new questions does this raise?"
                     logger.info(f"Dreaming led to next question: '{current_question_for_experts}'")
 
-            # 5. Collaboration Phase (Conditional)
-            if turn_num % COLLAB_INTERVAL == 0:
+            # 5. Collaboration Phase (Conditional, skipped in cheap mode or to save budget)
+            wants_collaboration = not cheap_mode and not session_ending and turn_num % COLLAB_INTERVAL == 0
+            if wants_collaboration and (budget_policy["skip_collaboration"] or budget_policy["end_session"]):
+                _shed_phase(session_log, turn_num, "collaboration", budget_policy["reasons"])
+            elif wants_collaboration:
                 logger.info(f"\n--- Collaborating on '{initial_topic}' ---")
                 # Choose an idea to collaborate on
                 idea_for_collaboration = (
@@ -198,14 +390,15 @@ def run_learning_session():
                 )
                 collaboration_data = collaborate_on_ideas(
                     super_agent_api_client,
-                    EXPERT_LLM_INSTANCES,
+                    available_experts,
                     initial_topic,
                     idea_for_collaboration,
                     selected_super_agent_profile["collaboration_style"],
-                    EXPERT_AGENT_PROFILES # Pass full expert profiles for their modes
+                    EXPERT_AGENT_PROFILES, # Pass full expert profiles for their modes
+                    selected_super_agent_profile["model"] # Synthesis uses the Super Agent's own model
                 )
                 current_turn_data["collaboration_data"] = collaboration_data
-                logger.info(f"Collaboration Result: {collaboration_data.get('summary', 'No summary provided')}")
+                logger.info(f"Collaboration Result ({collaboration_data['rounds_completed']} round(s), {collaboration_data['stop_reason']}): {collaboration_data.get('summary', 'No summary provided')}")
 
                 # Collaboration might also lead to new questions
                 if collaboration_data.get("new_questions"):
@@ -214,20 +407,32 @@ def run_learning_session():
 
             # Finalize turn data timestamp
             current_turn_data["timestamp_turn_end"] = datetime.now().isoformat()
+            budget.mark_turn_complete()
+            current_turn_data["budget"] = budget.snapshot(by_phase=False) # Per-phase usage is in the session summary
 
-            # Add to session log (for human review) and individual training data files (for ML)
-            add_turn_to_session_log(session_log, current_turn_data)
+            # Write the individual training data files (for ML), then spill the turn to the
+            # session journal (for human review) so only a stub stays in memory
             append_training_data_from_turn(current_turn_data)
+            add_turn_to_session_log(session_log, current_turn_data)
+            increment("learning_turns_completed_total")
 
             # Add concise turn data to learning history for next iteration's prompt
-            learning_history.add_turn({
-                "turn_number": current_turn_data["turn_number"],
-                "question_asked": current_turn_data["question_asked"],
-                "super_agent_synthesis_summary": current_turn_data["super_agent_synthesis"][:250] + "...",
-                "grade_overall": current_turn_data["grade_data"].get("overall_grade", "N/A"),
-                "reflection_summary": current_turn_data["reflection_data"].get("reflection_summary", "")[:100] + "..."
-            })
-
+            learning_history.add_turn(_history_entry(current_turn_data))
+
+            # Stop (or economize) once marginal learning has dropped below threshold
+            if convergence["converged"]:
+                if not session_ending:
+                    cheap_mode = True
+                    expert_top_k = CHEAP_MODE_EXPERT_TOP_K
+                    convergence_monitor = ConvergenceMonitor() # Give the cheap mode a fresh window
+                    session_log.setdefault("mode_changes", []).append(
+                        {"turn_number": turn_num, "mode": "cheap", "reason": convergence["reason"]}
+                    )
+                    logger.info(f"Learning has plateaued ({convergence['reason']}). Switching to cheap mode.")
+                else:
+                    session_log["termination_reason"] = f"converged: {convergence['reason']}"
+                    logger.info(f"Learning has converged ({convergence['reason']}). Ending session.")
+                    break
 
             # Set next question if not already determined by dreaming/collaboration
             if current_question_for_experts == current_turn_data["question_asked"]: # Check if it wasn't updated
@@ -235,20 +440,124 @@ def run_learning_session():
                     current_question_for_experts = current_turn_data["next_questions"][0]
                  else:
                     logger.info("Super Agent has no new questions. Learning session complete.")
+                    session_log["termination_reason"] = "no_new_questions"
                     break
 
         except ConnectionError as e:
             logger.error(f"API Error during turn {turn_num}: {e}. Ending learning session.", exc_info=True)
+            session_log["termination_reason"] = f"api_error: {e}"
             break
         except Exception as e:
             logger.error(f"Unexpected error during turn {turn_num}: {e}. Ending learning session.", exc_info=True)
+            session_log["termination_reason"] = f"error: {e}"
             break
 
-        time.sleep(2) # Pause between turns for readability
+        with budget.paused(): # Not charged to the time budget
+            time.sleep(2) # Pause between turns for readability
+
+    return _finish_session(session_id, initial_topic, session_log, selected_super_agent_profile, budget, prefetcher)
+
+def _explore_beam(session_id, initial_topic, root_question, super_agent_profile, session_log, budget):
+    """Runs a beam-search session: every evaluated branch is logged as a turn."""
+    profile_name = super_agent_profile["profile_name"]
+
+    def _evaluate_branch(question, history_entries):
+        branch_history = LearningHistory(session_id, max_turns=MAX_LEARNING_TURNS)
+        for entry in history_entries:
+            branch_history.add_turn(entry)
+        prompt_history = branch_history.get_concise_history_for_prompt()
+        turn_data = {
+            "session_id": session_id,
+            "timestamp_turn_start": datetime.now().isoformat(),
+            "initial_topic": initial_topic,
+            "super_agent_knowledge_state": super_agent_profile.get("current_knowledge_state", "novice"),
+            "question_asked": question,
+            "reflection_data": {},
+            "dream_data": {},
+            "collaboration_data": {}
+        }
+        turn_results = simulate_learning_turn(
+            super_agent_api_client,
+            expert_selector.select(EXPERT_LLM_INSTANCES, initial_topic, profile_name),
+            initial_topic,
+            question,
+            prompt_history,
+            super_agent_profile
+        )
+        turn_data.update({
+            "expert_responses": turn_results["expert_responses"],
+            "super_agent_synthesis": turn_results["super_agent_synthesis"],
+            "next_questions": turn_results["next_questions_for_experts"]
+        })
+        turn_data["grade_data"] = grade_learning_turn(
+            super_agent_api_client,
+            initial_topic,
+            question,
+            turn_data["expert_responses"],
+            turn_data["super_agent_synthesis"],
+            turn_data["next_questions"],
+            prompt_history
+        )
+        turn_data["timestamp_turn_end"] = datetime.now().isoformat()
+        return turn_data
+
+    def _log_branch(node, turn_data):
+        # Branches are numbered in the order they finish; "beam" links them into the search tree
+        turn_data["turn_number"] = len(session_log["turns"]) + 1
+        turn_data["beam"] = {"node_id": node["id"], "parent_id": node["parent_id"], "depth": node["depth"], "score": node["score"]}
+        logger.info(f"Beam branch {node['id']} (depth {node['depth']}, grade {node['score']:.2f}): '{node['question']}'")
+        expert_selector.update(
+            initial_topic, profile_name, turn_data["expert_responses"], turn_data["super_agent_synthesis"],
+            turn_data["grade_data"], total_experts=len(EXPERT_LLM_INSTANCES)
+        )
+        append_training_data_from_turn(turn_data)
+        add_turn_to_session_log(session_log, turn_data)
+        increment("learning_turns_completed_total")
+        budget.mark_turn_complete()
+
+    explorer = BeamExplorer(
+        beam_width=BEAM_WIDTH,
+        branching_factor=BEAM_BRANCHING_FACTOR,
+        max_parallel_branches=BEAM_MAX_PARALLEL_BRANCHES,
+        token_budget=BEAM_TOKEN_BUDGET,
+        session_budget=budget
+    )
+    try:
+        beam_summary = explorer.explore(root_question, BEAM_MAX_DEPTH, _evaluate_branch, _history_entry, on_branch=_log_branch)
+    except Exception as e:
+        logger.error(f"Unexpected error during beam exploration: {e}. Ending learning session.", exc_info=True)
+        session_log["termination_reason"] = f"error: {e}"
+        return
+    session_log["beam_exploration"] = beam_summary
+    session_log["termination_reason"] = beam_summary["stop_reason"]
+    logger.info(f"Beam exploration finished ({beam_summary['stop_reason']}); best path: {beam_summary['best_path']}")
+
+def _finish_session(session_id, initial_topic, session_log, selected_super_agent_profile, budget, prefetcher):
+    if prefetcher:
+        session_log["speculative_prefetch"] = prefetcher.close()
+        logger.info(f"Speculative prefetch stats: {session_log['speculative_prefetch']}")
+
+    session_log["budget"] = budget.snapshot()
+    for phase, usage in session_log["budget"]["usage_by_phase"].items():
+        logger.info(
+            f"Prompt cache [{phase}]: {usage['cached_prompt_tokens']}/{usage['prompt_tokens']} prompt tokens cached "
+            f"(hit rate {usage['prompt_cache_hit_rate']}) over {usage['calls']} call(s)"
+        )
 
     # Finalize and save the comprehensive session log
-    finalize_session_log(session_log, selected_super_agent_profile)
+    log_filename = finalize_session_log(session_log, selected_super_agent_profile)
+    expert_selector.save()
     logger.info(f"--- Super Agent Learning session complete. Log saved to: {session_log['session_id']}.json ---")
+    logger.info(f"Metrics: {json.dumps(metrics_snapshot(), indent=2)}")
+
+    return {
+        "session_id": session_id,
+        "initial_topic": initial_topic,
+        "session_log_path": log_filename,
+        "turns_completed": len(session_log["turns"]),
+        "termination_reason": session_log["termination_reason"]
+    }
 
 if __name__ == "__main__":
+    maybe_start_metrics_server()
     run_learning_session()
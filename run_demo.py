@@ -1,4 +1,9 @@
+from dotenv import load_dotenv
+
+load_dotenv() # Before our imports, which read their settings at import time
 from main_learning_loop import run_learning_session
+from _metrics import maybe_start_metrics_server
 
 if __name__ == "__main__":
+    maybe_start_metrics_server()
     run_learning_session()
@@ -0,0 +1,56 @@
+import argparse
+import logging
+import multiprocessing
+
+from dotenv import load_dotenv
+
+# Load .env before importing our modules: several read their settings (queue URL, HTTP_*, METRICS_*) at import time
+load_dotenv()
+
+from _job_queue import DEFAULT_QUEUE_URL, DEFAULT_MAX_ATTEMPTS, get_job_queue
+from _worker import run_worker, default_worker_id
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def _worker_process(queue_url, worker_id, exit_when_empty, metrics_port_offset):
+    run_worker(queue_url, worker_id=worker_id, exit_when_empty=exit_when_empty, metrics_port_offset=metrics_port_offset)
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed learning-session workers backed by a durable job queue.")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_URL, help="Job queue URL (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="Queue one learning session per topic")
+    enqueue_parser.add_argument("topics", nargs="+")
+    enqueue_parser.add_argument("--profile", default=None, help="Super Agent profile key (default: the loop's default)")
+    enqueue_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+
+    worker_parser = subparsers.add_parser("work", help="Run worker process(es) that claim and execute jobs")
+    worker_parser.add_argument("--processes", type=int, default=1)
+    worker_parser.add_argument("--exit-when-empty", action="store_true")
+
+    subparsers.add_parser("status", help="Show job counts by status")
+
+    args = parser.parse_args()
+    if args.command == "enqueue":
+        queue = get_job_queue(args.queue)
+        for topic in args.topics:
+            job_id = queue.enqueue(topic, super_agent_profile_key=args.profile, max_attempts=args.max_attempts)
+            print(f"Queued job {job_id}: {topic}")
+    elif args.command == "status":
+        print(get_job_queue(args.queue).stats())
+    elif args.processes == 1:
+        run_worker(args.queue, exit_when_empty=args.exit_when_empty)
+    else:
+        base_id = default_worker_id()
+        processes = [
+            multiprocessing.Process(target=_worker_process, args=(args.queue, f"{base_id}-{i}", args.exit_when_empty, i))
+            for i in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# test_structured_output.py
+import pytest
+
+from _structured_output import StructuredOutputError, parse_structured_output
+
+def test_valid_json_is_not_repaired():
+    payload, repaired = parse_structured_output('{"synthesis": "x", "new_questions": []}', "synthesis")
+    assert payload == {"synthesis": "x", "new_questions": []}
+    assert not repaired
+
+def test_trailing_commas_inside_strings_are_kept():
+    content = '```json\n{"synthesis": "Options (a, b, }) and [x, ]", "new_questions": []}\n```'
+    payload, repaired = parse_structured_output(content, "synthesis")
+    assert payload["synthesis"] == "Options (a, b, }) and [x, ]"
+    assert repaired
+
+def test_trailing_commas_outside_strings_are_removed():
+    content = 'Here you go: {"synthesis": "a, ]", "new_questions": ["q1", "q2",],}'
+    payload, repaired = parse_structured_output(content, "synthesis")
+    assert payload == {"synthesis": "a, ]", "new_questions": ["q1", "q2"]}
+    assert repaired
+
+def test_escaped_quotes_do_not_end_a_string():
+    content = '```\n{"synthesis": "say \\"a, }\\" twice", "new_questions": [],}\n```'
+    payload, _ = parse_structured_output(content, "synthesis")
+    assert payload["synthesis"] == 'say "a, }" twice'
+
+def test_literal_newline_inside_string_is_accepted():
+    payload, _ = parse_structured_output('{"synthesis": "x\n y", "new_questions": []}', "synthesis")
+    assert payload["synthesis"] == "x\n y"
+
+def test_python_literals_are_converted_outside_strings_only():
+    content = "{'synthesis': 'It is True that None of it', 'new_questions': [], 'extra': None,}"
+    payload, repaired = parse_structured_output(content, "synthesis")
+    assert payload["synthesis"] == "It is True that None of it"
+    assert payload["extra"] is None
+    assert repaired
+
+def test_unrecoverable_reply_raises():
+    with pytest.raises(StructuredOutputError):
+        parse_structured_output('{"synthesis": "unterminated', "synthesis")